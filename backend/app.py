@@ -1,29 +1,94 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from pymongo import MongoClient
-from flask_socketio import SocketIO, send, emit
+from pymongo.errors import DuplicateKeyError
+from flask_socketio import SocketIO, send, emit, join_room, leave_room, rooms
 import bcrypt
 import os
 from dotenv import load_dotenv
 import certifi
 from bson.objectid import ObjectId  # Import ObjectId
+from datetime import datetime, timezone
+from indexes import ensure_indexes, has_unique_index
+from pagination import page_params, find_page, page_response, NEXT_CURSOR_HEADER, MAX_PAGE_SIZE
+from streaming import stream_format, stream_docs
+from response_cache import ResponseCache
+from singleflight import SingleFlight
+from command_counter import CommandCounter, commands_issued, COMMAND_COUNT_HEADER
+from chat_writer import WriteBehindBuffer
+from chat_store import ChatBuckets
+from chat_sync import RoomLog
+from call_sessions import CallRegistry, call_room
+from serialization import jsonable, json_response
+from export import parse_date
+from itertools import islice
+import atexit
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=[NEXT_CURSOR_HEADER, COMMAND_COUNT_HEADER])
 socketio = SocketIO(app, cors_allowed_origins="*")
 
 # MongoDB connection with certifi for SSL certificate handling
 MONGODB_URI = os.getenv('MONGODB_URI')
 ca = certifi.where()
-client = MongoClient(MONGODB_URI, tlsCAFile=ca)
+# Counts the commands each request sends, reported in the X-Mongo-Commands response header
+command_counter = CommandCounter()
+client = MongoClient(MONGODB_URI, tlsCAFile=ca, event_listeners=[command_counter])
 db = client['StudyGroupMatcher']
 users_collection = db['users']
 meetings_collection = db['meetings']
 groups_collection = db['groups']
-chats_collection = db['chats']  # Added collection for chats
+chats_collection = db['chats']  # Flat messages from before chat_buckets; see migrate.py bucket-chats
+chat_buckets_collection = db['chat_buckets']  # Chat history, bucketed per group and hour
+matches_collection = db['matches']  # Written by the nightly match_job.py
+
+# Serialized /api/meetings and /api/groups pages, invalidated by the meeting/group write routes
+response_cache = ResponseCache(max_entries=int(os.getenv('RESPONSE_CACHE_SIZE', 256)))
+# Concurrent cache misses for the same page share one MongoDB query; waiters block on
+# events from the Socket.IO server so they yield properly under eventlet
+page_flights = SingleFlight(event_factory=socketio.server.eio.create_event)
+
+def coalesced_page(endpoint, collection, limit, after):
+    """find_page, run once for all concurrent requests for the same page"""
+    return page_flights.do(f"{endpoint}:{limit}:{after}", lambda: find_page(collection, limit, after))
+
+chat_store = ChatBuckets(chat_buckets_collection)
+# Longest chat message accepted; keeps bucket documents well inside MongoDB's 16 MB limit
+MAX_MESSAGE_LENGTH = int(os.getenv('CHAT_MAX_MESSAGE_LENGTH', 4000))
+MAX_USERNAME_LENGTH = 100
+# Per-room message sequence numbers, with each room's latest messages kept for reconnect resyncs
+room_log = RoomLog(chat_store, ring_size=int(os.getenv('CHAT_RING_SIZE', 500)))
+# Video calls and their participants, so WebRTC signaling goes only to the peers of a call
+call_registry = CallRegistry()
+# Chat messages are persisted in batches after they are sent, off the delivery path
+chat_writer = WriteBehindBuffer(
+    chat_store,
+    create_queue=socketio.server.eio.create_queue,
+    start_task=socketio.start_background_task,
+    sleep=socketio.sleep,
+    max_batch=int(os.getenv('CHAT_WRITE_BATCH', 100)),
+    flush_interval=float(os.getenv('CHAT_FLUSH_INTERVAL', 0.2)),
+    max_queue=int(os.getenv('CHAT_WRITE_QUEUE', 10000)),
+    # Messages stay in the room's resync ring until they are written
+    on_settled=room_log.settled
+)
+atexit.register(chat_writer.close)
+
+# Create any missing indexes from the registry in indexes.py (a no-op when they exist)
+ensure_indexes(db)
+# Signup relies on the unique username index to reject duplicates; if it could not be built
+# (e.g. existing duplicate usernames), signup checks for the username first instead
+username_index_ready = has_unique_index(users_collection, 'username')
+if not username_index_ready:
+    print("Warning: no unique username index; signup falls back to checking for duplicates first")
+
+@app.after_request
+def count_commands(response):
+    response.headers[COMMAND_COUNT_HEADER] = str(commands_issued())
+    return response
 
 @app.route("/")
 def hello_world():
@@ -37,12 +102,15 @@ def signup():
     email = data.get('email')
     password = data.get('password')
 
-    if users_collection.find_one({"username": username}):
-        return jsonify({"error": "Username already exists"}), 400
-
     hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
     user = {"username": username, "email": email, "password": hashed_password}
-    users_collection.insert_one(user)
+    if not username_index_ready and users_collection.find_one({"username": username}, {'_id': 1}):
+        return jsonify({"error": "Username already exists"}), 400
+    try:
+        # The unique username index rejects duplicates, so no lookup round trip is needed first
+        users_collection.insert_one(user)
+    except DuplicateKeyError:
+        return jsonify({"error": "Username already exists"}), 400
 
     return jsonify({"message": "User created successfully"}), 201
 
@@ -66,10 +134,17 @@ def login():
 @app.route('/api/meetings', methods=['GET'])
 def get_meetings():
     try:
-        meetings = list(meetings_collection.find())
-        for meeting in meetings:
-            meeting['_id'] = str(meeting['_id'])
-        return jsonify(meetings), 200
+        try:
+            limit, after = page_params(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        cached, generation = response_cache.lookup(request, 'meetings')
+        if cached is not None:
+            return cached
+
+        meetings, next_cursor = coalesced_page('meetings', meetings_collection, limit, after)
+        return response_cache.store(request, 'meetings', generation, page_response(meetings, next_cursor))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -90,6 +165,7 @@ def create_meeting():
             "description": data['description']
         }
         result = meetings_collection.insert_one(meeting)
+        response_cache.invalidate('meetings')
         return jsonify({"_id": str(result.inserted_id), "message": "Meeting created successfully"}), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -100,6 +176,7 @@ def delete_meeting(meeting_id):
     try:
         result = meetings_collection.delete_one({"_id": ObjectId(meeting_id)})
         if result.deleted_count > 0:
+            response_cache.invalidate('meetings')
             return jsonify({"message": "Meeting deleted successfully"}), 200
         else:
             return jsonify({"error": "Meeting not found"}), 404
@@ -125,6 +202,7 @@ def create_group():
             "description": data['description']
         }
         result = groups_collection.insert_one(group)  # Save group to MongoDB
+        response_cache.invalidate('groups')
         return jsonify({"_id": str(result.inserted_id), "message": "Group created successfully"}), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -133,48 +211,231 @@ def create_group():
 @app.route('/api/groups', methods=['GET'])
 def get_groups():
     try:
-        groups = list(groups_collection.find())  # Retrieve all documents from the collection
-        for group in groups:
-            group['_id'] = str(group['_id'])  # Convert ObjectId to string for JSON compatibility
-        return jsonify(groups), 200
+        try:
+            limit, after = page_params(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        cached, generation = response_cache.lookup(request, 'groups')
+        if cached is not None:
+            return cached  # Served from memory, or a 304 if the client's copy is current
+
+        groups, next_cursor = coalesced_page('groups', groups_collection, limit, after)  # One page, in _id order
+        return response_cache.store(request, 'groups', generation, page_response(groups, next_cursor))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+# Group ids arrive as strings; upper-case hex is valid too, so they are normalized
+# before naming a room or querying chat_buckets
+def group_room(group_id):
+    """The room name and stored group_id for a group id: its lowercase hex, or None if invalid"""
+    return str(ObjectId(group_id)) if ObjectId.is_valid(group_id) else None
+
+def seq_param(args):
+    """after_seq as a non-negative int; raises ValueError if invalid"""
+    try:
+        after_seq = int(args['after_seq'])
+    except ValueError:
+        raise ValueError("after_seq must be an integer")
+    if after_seq < 0:
+        raise ValueError("after_seq must not be negative")
+    return after_seq
+
 # Fetch all chat messages
 @app.route('/api/chats', methods=['GET'])
 def get_chats():
     try:
-        chats = list(chats_collection.find())
-        for chat in chats:
-            chat['_id'] = str(chat['_id'])
-        return jsonify(chats), 200
+        if 'after_seq' in request.args:
+            return get_chats_after_seq()
+        try:
+            limit, after = page_params(request.args)
+            since = parse_date(request.args['since']) if request.args.get('since') else None
+            until = parse_date(request.args['until']) if request.args.get('until') else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # ?group_id= limits the history to one group's room, ?since=/?until= to a time range;
+        # only the buckets overlapping the range are read
+        group_id = request.args.get('group_id')
+        messages = chat_store.history(group_room(group_id) or group_id, since, until, after)
+        fmt = stream_format(request)
+        if fmt:
+            # Whole range, encoded as the buckets are read
+            return stream_docs(messages, fmt)
+
+        chats = list(islice(messages, limit + 1))
+        next_cursor = str(chats[limit - 1]['_id']) if len(chats) > limit else None
+        return page_response(chats[:limit], next_cursor), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def get_chats_after_seq():
+    """Reconnect resync: the messages of one group's room after a seq, oldest first"""
+    group_id = group_room(request.args.get('group_id'))
+    if group_id is None:
+        return jsonify({"error": "after_seq needs a valid group_id"}), 400
+    try:
+        limit, _ = page_params(request.args)
+        after_seq = seq_param(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # Rooms are only kept in memory for real groups
+    if not room_log.known(group_id) and groups_collection.count_documents({'_id': ObjectId(group_id)}, limit=1) == 0:
+        return jsonify({"error": "Group not found"}), 404
+
+    # Served from the room's ring buffer when it still holds the whole gap
+    messages = room_log.after(group_id, after_seq, limit + 1)
+    return json_response({
+        "messages": [jsonable(message) for message in messages[:limit]],
+        "last_seq": room_log.last_seq(group_id),
+        "has_more": len(messages) > limit  # Ask again after the last message's seq
+    })
+
 # WebSocket chat and signaling for video calls
+# Chat is scoped to one Socket.IO room per study group, named by the group's _id
+@socketio.on('join')
+def handle_join(data):
+    group_id = group_room(data.get('group_id'))
+    if group_id is None:
+        emit('error', {"error": "Invalid group ID"})
+        return
+    if groups_collection.count_documents({'_id': ObjectId(group_id)}, limit=1) == 0:
+        emit('error', {"error": "Group not found"})
+        return
+
+    join_room(group_id)
+    emit('joined', {"group_id": group_id, "last_seq": room_log.last_seq(group_id)})
+    if data.get('after_seq') is not None:
+        # Rejoining after a disconnect: send the missed messages straight away
+        handle_sync(data)
+
+@socketio.on('leave')
+def handle_leave(data):
+    group_id = group_room(data.get('group_id'))
+    if group_id in rooms():
+        leave_room(group_id)
+    emit('left', {"group_id": group_id})
+
+@socketio.on('sync')
+def handle_sync(data):
+    group_id = group_room(data.get('group_id'))
+    if group_id is None or group_id not in rooms():
+        emit('error', {"error": "Join the group before syncing it"})
+        return
+    try:
+        after_seq = seq_param(data)
+    except (KeyError, TypeError, ValueError):
+        emit('error', {"error": "after_seq must be a non-negative integer"})
+        return
+
+    messages = room_log.after(group_id, after_seq, MAX_PAGE_SIZE + 1)
+    emit('sync', {
+        "group_id": group_id,
+        "messages": [jsonable(message) for message in messages[:MAX_PAGE_SIZE]],
+        "last_seq": room_log.last_seq(group_id),
+        "has_more": len(messages) > MAX_PAGE_SIZE  # Sync again after the last message's seq
+    })
+
 @socketio.on('message')
 def handle_message(data):
-    # Save the chat message to the database
+    group_id = group_room(data.get('group_id'))
+    # Only members of a group's room may post to it (every client is also in a room named by its sid)
+    if group_id is None or group_id not in rooms():
+        emit('error', {"error": "Join the group before sending messages to it"})
+        return
+    username, text = data.get("username"), data.get("text")
+    if not isinstance(username, str) or not isinstance(text, str):
+        emit('error', {"error": "username and text must be strings"})
+        return
+    if len(text) > MAX_MESSAGE_LENGTH or len(username) > MAX_USERNAME_LENGTH:
+        emit('error', {"error": f"Messages are limited to {MAX_MESSAGE_LENGTH} characters"})
+        return
+
     chat_message = {
-        "username": data["username"],
-        "text": data["text"]
+        "_id": ObjectId(),  # Assigned now so ids follow send order
+        "group_id": group_id,
+        "username": username,
+        "text": text,
+        "created_at": datetime.now(timezone.utc)
     }
-    chats_collection.insert_one(chat_message)
+    # Number it in the room's sequence, send it to the group's members only, then queue it to be saved
+    room_log.stamp(chat_message)
+    send(jsonable(chat_message), to=group_id)
+    chat_writer.write(chat_message)
+
+# Video calls: a member of a group's room starts a call, other members join it by call_id,
+# and signaling is addressed to one peer's sid or to the call's own room
+@socketio.on('call-start')
+def handle_call_start(data):
+    group_id = group_room(data.get('group_id'))
+    if group_id is None or group_id not in rooms():
+        emit('error', {"error": "Join the group before starting a call in it"})
+        return
+
+    call_id = call_registry.start(group_id, request.sid)
+    join_room(call_room(call_id))
+    emit('call-started', {"call_id": call_id})
+    # Let the rest of the group know there is a call to join
+    emit('call-available', {"call_id": call_id, "group_id": group_id, "from": request.sid},
+         to=group_id, include_self=False)
+
+@socketio.on('call-join')
+def handle_call_join(data):
+    call_id = data.get('call_id')
+    group_id = call_registry.group_of(call_id)
+    if group_id is None or group_id not in rooms():
+        emit('error', {"error": "No such call in a group you have joined"})
+        return
+
+    peers = call_registry.join(call_id, request.sid)
+    if peers is None:  # Ended meanwhile
+        emit('error', {"error": "No such call in a group you have joined"})
+        return
+    join_room(call_room(call_id))
+    # The newcomer sends an offer to each peer listed here
+    emit('call-joined', {"call_id": call_id, "peers": peers})
+    emit('peer-joined', {"call_id": call_id, "sid": request.sid}, to=call_room(call_id), include_self=False)
 
-    # Broadcast the message to all connected clients
-    send(data, broadcast=True)
+def leave_call(call_id, sid):
+    if call_registry.leave(call_id, sid):
+        leave_room(call_room(call_id), sid=sid)
+        emit('peer-left', {"call_id": call_id, "sid": sid}, to=call_room(call_id))
+
+@socketio.on('call-leave')
+def handle_call_leave(data):
+    leave_call(data.get('call_id'), request.sid)
+    emit('call-left', {"call_id": data.get('call_id')})
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    for call_id in call_registry.calls_of(request.sid):
+        leave_call(call_id, request.sid)
+
+def relay_signal(event, data):
+    """Relay an offer, answer or ICE candidate to data['to'], or to the rest of data['call_id']'s call"""
+    call_id = data.get('call_id')
+    to = data.get('to')
+    if not call_registry.check_signal(call_id, request.sid, to):
+        emit('error', {"error": f"{event} must name a call you are in and, optionally, a peer in it"})
+        return
+    # Tag the sender so the receiver can address its reply
+    emit(event, dict(data, **{"from": request.sid}), to=to or call_room(call_id), include_self=False)
 
 @socketio.on('offer')
 def handle_offer(data):
-    emit('offer', data, broadcast=True, include_self=False)
+    relay_signal('offer', data)
 
 @socketio.on('answer')
 def handle_answer(data):
-    emit('answer', data, broadcast=True, include_self=False)
+    relay_signal('answer', data)
 
 @socketio.on('ice-candidate')
 def handle_ice_candidate(data):
-    emit('ice-candidate', data, broadcast=True, include_self=False)
+    relay_signal('ice-candidate', data)
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5001))
-    socketio.run(app, host="0.0.0.0", port=port)
+    try:
+        socketio.run(app, host="0.0.0.0", port=port)
+    finally:
+        chat_writer.close()
@@ -0,0 +1,141 @@
+"""Weekly availability as a 168-bit hourly slot bitmap.
+
+Bit (day * 24 + hour) is set when the student is free during that hour,
+with Monday as day 0. Free-text tokens are parsed into the bitmap:
+
+    "monday"              the whole day
+    "mon 9-11", "tue 2-4pm", "wednesday 14:00-16:30"
+    "friday evening"      see PERIODS
+    "weekdays", "weekends afternoon"
+
+Tokens that cannot be parsed are kept as-is and only ever match by equality.
+"""
+import re
+
+DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+HOURS_PER_DAY = 24
+HOURS_PER_WEEK = 7 * HOURS_PER_DAY
+# Stored as little-endian bytes, so bit n of the bitmap is bit n of the BinData for $bitsAnySet
+SLOT_BYTES = HOURS_PER_WEEK // 8
+
+DAY_ALIASES = {
+    'mon': 'monday', 'tue': 'tuesday', 'tues': 'tuesday', 'wed': 'wednesday',
+    'thu': 'thursday', 'thur': 'thursday', 'thurs': 'thursday', 'fri': 'friday',
+    'sat': 'saturday', 'sun': 'sunday'
+}
+DAY_GROUPS = {
+    'weekdays': DAYS[:5],
+    'weekday': DAYS[:5],
+    'weekends': DAYS[5:],
+    'weekend': DAYS[5:],
+    'everyday': DAYS,
+    'daily': DAYS
+}
+PERIODS = {
+    'morning': (8, 12),
+    'afternoon': (12, 17),
+    'evening': (17, 21),
+    'night': (21, 24)
+}
+
+_TOKEN = re.compile(r'^([a-z]+)(?:\s+(.+))?$')
+_RANGE = re.compile(
+    r'^(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\s*-\s*(\d{1,2})(?::(\d{2}))?\s*(am|pm)?$')
+
+def _days(word):
+    if word in DAY_GROUPS:
+        return DAY_GROUPS[word]
+    day = DAY_ALIASES.get(word, word)
+    return [day] if day in DAYS else None
+
+def _to_24h(hour, suffix):
+    if suffix == 'am':
+        return 0 if hour == 12 else hour
+    if suffix == 'pm':
+        return hour if hour == 12 else hour + 12
+    return hour
+
+def _hours(text):
+    """Parse the time part of a token into a [start, end) hour range, or None"""
+    if text is None:
+        return 0, HOURS_PER_DAY
+    if text in PERIODS:
+        return PERIODS[text]
+    match = _RANGE.match(text)
+    if not match:
+        return None
+    start_hour, start_minute, start_suffix, end_hour, end_minute, end_suffix = match.groups()
+    end = _to_24h(int(end_hour), end_suffix)
+    start = _to_24h(int(start_hour), start_suffix or end_suffix)
+    if start_suffix is None and start >= end:
+        # "11-1pm": the suffix only applied to the end
+        start = _to_24h(int(start_hour), None)
+    # Partial hours count as the whole hour slot
+    if end_minute and int(end_minute) > 0:
+        end += 1
+    minutes = [int(minute) for minute in (start_minute, end_minute) if minute]
+    if not 0 <= start < end <= HOURS_PER_DAY or any(minute >= 60 for minute in minutes):
+        return None
+    return start, end
+
+def parse_token(token):
+    """Bitmap for one normalized availability token, or None if it is not a time slot"""
+    match = _TOKEN.match(token)
+    if not match:
+        return None
+    days = _days(match.group(1))
+    hours = _hours(match.group(2))
+    if days is None or hours is None:
+        return None
+    day_bits = ((1 << (hours[1] - hours[0])) - 1) << hours[0]
+    mask = 0
+    for day in days:
+        mask |= day_bits << (DAYS.index(day) * HOURS_PER_DAY)
+    return mask
+
+def to_bitmap(tokens):
+    """Return (bitmap, unparsed tokens) for a list of normalized tokens"""
+    mask = 0
+    unparsed = []
+    for token in tokens:
+        bits = parse_token(token)
+        if bits is None:
+            unparsed.append(token)
+        else:
+            mask |= bits
+    return mask, unparsed
+
+def to_bytes(mask):
+    return mask.to_bytes(SLOT_BYTES, 'little')
+
+def from_bytes(data):
+    return int.from_bytes(data, 'little') if data else 0
+
+def hours(mask):
+    """Number of free hours in a bitmap"""
+    return bin(mask).count('1')
+
+def day_keys(mask):
+    """Coarse 'day:<name>' keys for every day with at least one free hour"""
+    day_bits = (1 << HOURS_PER_DAY) - 1
+    return [f"day:{day}" for i, day in enumerate(DAYS) if (mask >> (i * HOURS_PER_DAY)) & day_bits]
+
+def describe(mask):
+    """Canonical tokens for a bitmap: whole days by name, otherwise 'day start-end' runs"""
+    tokens = []
+    day_bits = (1 << HOURS_PER_DAY) - 1
+    for i, day in enumerate(DAYS):
+        bits = (mask >> (i * HOURS_PER_DAY)) & day_bits
+        if bits == day_bits:
+            tokens.append(day)
+            continue
+        hour = 0
+        while hour < HOURS_PER_DAY:
+            if not bits >> hour & 1:
+                hour += 1
+                continue
+            start = hour
+            while hour < HOURS_PER_DAY and bits >> hour & 1:
+                hour += 1
+            tokens.append(f"{day} {start}-{hour}")
+    return tokens
@@ -0,0 +1,243 @@
+"""Matching and serialization benchmarks over synthetic profiles.
+
+    python bench.py --sizes 1000,100000 --queries 50 --output bench.json
+    python bench.py --sizes 1000 --baseline bench.json   # compare against an earlier run
+    python bench.py --sizes 1000 --endpoint http://localhost:5001
+
+Reports p50/p99 latency, throughput and peak traced memory as JSON.
+"""
+import argparse
+from datetime import datetime, timezone
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.request
+import bson
+from bson import ObjectId
+from flask import Flask, jsonify
+from models import Profile, find_match
+from columnar import ProfileStore
+from lsh import ProfileLSH
+from pagination import DEFAULT_PAGE_SIZE
+from serialization import JSON_CODEC_OPTIONS, dumps
+import synthetic
+
+class ObjectEngine:
+    """The per-object Profile/find_match path"""
+    def __init__(self, profiles):
+        self.profiles = profiles
+
+    def query(self, source):
+        return [p._id for p in self.profiles if p is not source and find_match(source, p) == "Matched"]
+
+class ColumnarEngine:
+    """columnar.ProfileStore batch matcher"""
+    def __init__(self, profiles):
+        self.store = ProfileStore(profiles)
+        self.store.columns()
+
+    def query(self, source):
+        return [m.profile._id for m in self.store.find_matches(source) if m.profile is not source]
+
+class LSHEngine:
+    """MinHash/LSH candidates verified with find_match"""
+    def __init__(self, profiles):
+        self.profiles = {p._id: p for p in profiles}
+        self.lsh = ProfileLSH()
+        self.lsh.index_profiles(profiles)
+
+    def candidates(self, source):
+        candidates = self.lsh.candidates(source.subjects, source.availability_keys())
+        candidates.discard(source._id)
+        return candidates
+
+    def query(self, source):
+        return [key for key in self.candidates(source) if find_match(source, self.profiles[key]) == "Matched"]
+
+ENGINES = {
+    'object': ObjectEngine,
+    'columnar': ColumnarEngine,
+    'lsh': LSHEngine
+}
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def summarize(latencies, **fields):
+    total = sum(latencies)
+    return {
+        **fields,
+        "samples": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 4),
+        "throughput_per_s": round(len(latencies) / total, 2) if total else None
+    }
+
+def peak_memory_mb(fn):
+    """Peak traced allocation while running fn, in MB"""
+    tracemalloc.start()
+    try:
+        fn()
+        return round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+    finally:
+        tracemalloc.stop()
+
+def bench_profile_init(docs):
+    latencies = []
+    for doc in docs:
+        started = time.perf_counter()
+        Profile(doc['name'], doc['subjects'], doc['availability'], doc['location'], _id=doc['_id'])
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies, case='profile_init')
+
+def _jsonify_page(raw):
+    """The old read path: decode, convert _id in a loop, then jsonify"""
+    docs = bson.decode_all(raw)
+    for doc in docs:
+        doc['_id'] = str(doc['_id'])
+    return jsonify(docs).get_data()
+
+def _codec_page(raw):
+    """serialization.json_view + json_response"""
+    return dumps(bson.decode_all(raw, JSON_CODEC_OPTIONS)).encode()
+
+SERIALIZERS = {
+    'jsonify': _jsonify_page,
+    'codec': _codec_page
+}
+
+def bench_serialization(docs):
+    """Time turning one page of raw BSON documents into a JSON body, per serializer"""
+    created_at = datetime.now(timezone.utc)
+    pages = [b''.join(bson.encode(dict(doc, _id=ObjectId(), created_at=created_at))
+                      for doc in docs[start:start + DEFAULT_PAGE_SIZE])
+             for start in range(0, len(docs), DEFAULT_PAGE_SIZE)]
+    results = []
+    with Flask(__name__).app_context():
+        for name, serialize in SERIALIZERS.items():
+            latencies = []
+            for raw in pages:
+                started = time.perf_counter()
+                serialize(raw)
+                latencies.append(time.perf_counter() - started)
+            results.append(summarize(latencies, case='serialize', engine=name, page_size=DEFAULT_PAGE_SIZE))
+    return results
+
+def bench_engine(name, profiles, sources, reference=None):
+    engine_class = ENGINES[name]
+    started = time.perf_counter()
+    engine = engine_class(profiles)
+    build_s = time.perf_counter() - started
+
+    latencies = []
+    recalls = []
+    # Share of the population an engine that narrows to candidates first has to verify
+    fractions = []
+    for source in sources:
+        started = time.perf_counter()
+        found = engine.query(source)
+        latencies.append(time.perf_counter() - started)
+        if reference is not None:
+            expected = reference[source._id]
+            recalls.append(len(expected & set(found)) / len(expected) if expected else 1.0)
+        if hasattr(engine, 'candidates'):
+            fractions.append(len(engine.candidates(source)) / len(profiles))
+
+    result = summarize(latencies, case='match', engine=name, build_s=round(build_s, 4))
+    result["peak_mb"] = peak_memory_mb(lambda: engine_class(profiles).query(sources[0]))
+    if recalls:
+        result["recall"] = round(sum(recalls) / len(recalls), 4)
+    if fractions:
+        result["candidate_fraction"] = round(sum(fractions) / len(fractions), 4)
+    return result, engine
+
+def bench_endpoint(base_url, queries, seed):
+    # Every profile id, streamed rather than paged, so the sample is drawn from the whole population
+    with urllib.request.urlopen(f"{base_url}/api/profiles?stream=ndjson&fields=_id") as response:
+        ids = [json.loads(line)['_id'] for line in response if line.strip()]
+    sampled = random.Random(seed).sample(ids, min(queries, len(ids)))
+    latencies = []
+    for profile_id in sampled:
+        started = time.perf_counter()
+        with urllib.request.urlopen(f"{base_url}/api/matches/{profile_id}") as response:
+            response.read()
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies, case='endpoint', url=base_url, population=len(ids))
+
+def run(sizes, engines, queries, seed=0, endpoint=None):
+    results = []
+    for size in sizes:
+        docs = [dict(doc, _id=str(i)) for i, doc in enumerate(synthetic.generate_docs(size, seed=seed))]
+        results.append(dict(bench_profile_init(docs), size=size))
+        results.extend(dict(result, size=size) for result in bench_serialization(docs))
+        profiles = [Profile(d['name'], d['subjects'], d['availability'], d['location'], _id=d['_id']) for d in docs]
+        sources = random.Random(seed).sample(profiles, min(queries, size))
+
+        # The first engine listed is treated as exact; the others report recall against it
+        reference = None
+        for name in engines:
+            result, engine = bench_engine(name, profiles, sources, reference)
+            results.append(dict(result, size=size))
+            if reference is None:
+                reference = {source._id: set(engine.query(source)) for source in sources}
+            print(json.dumps(results[-1]), file=sys.stderr)
+
+    if endpoint:
+        results.append(bench_endpoint(endpoint, queries, seed))
+    return results
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
+def _result_key(result):
+    return (result.get('size'), result['case'], result.get('engine'))
+
+def compare(report, baseline):
+    """Print p50/p99 ratios of report against a baseline report"""
+    previous = {_result_key(result): result for result in baseline['results']}
+    for result in report['results']:
+        before = previous.get(_result_key(result))
+        if before is None:
+            continue
+        ratios = ', '.join(f"{metric} x{result[metric] / before[metric]:.2f}"
+                           for metric in ('p50_ms', 'p99_ms') if before.get(metric))
+        print(f"{_result_key(result)}: {ratios}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark profile matching")
+    parser.add_argument('--sizes', default='1000,100000', help="comma-separated population sizes")
+    parser.add_argument('--engines', default=','.join(ENGINES), help=f"comma-separated, from {', '.join(ENGINES)}")
+    parser.add_argument('--queries', type=int, default=50, help="source profiles to match per size")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--endpoint', help="base URL of a running server to time /api/matches against")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="JSON report from an earlier run to compare against")
+    args = parser.parse_args()
+
+    report = {
+        "meta": metadata(),
+        "results": run([int(size) for size in args.sizes.split(',')], args.engines.split(','),
+                       args.queries, args.seed, args.endpoint)
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
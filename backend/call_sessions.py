@@ -0,0 +1,97 @@
+"""Registry of video call sessions for addressed WebRTC signaling.
+
+A call belongs to a study group and has a Socket.IO room named
+'call:<call_id>' holding its participants' sids. Offers, answers and ICE
+candidates carry a call_id and, for one peer, that peer's sid in 'to'; they
+are relayed to that sid or, without 'to', to the rest of the call room,
+only ever from and to participants of the same call. Like the rooms, the
+registry lives in this process.
+"""
+from datetime import datetime, timezone
+import threading
+from bson import ObjectId
+
+def call_room(call_id):
+    return f"call:{call_id}"
+
+class _Call:
+    def __init__(self, group_id):
+        self.group_id = group_id
+        self.participants = set()  # sids
+        self.started_at = datetime.now(timezone.utc)
+
+class CallRegistry:
+    def __init__(self):
+        self._calls = {}  # call_id -> _Call
+        self._calls_by_sid = {}  # sid -> call_ids it is in
+        self._lock = threading.Lock()
+        self.started = 0
+        self.relayed = 0
+        self.rejected = 0
+
+    def start(self, group_id, sid):
+        """Open a call in a group with sid as its first participant; returns the call_id"""
+        call_id = str(ObjectId())
+        with self._lock:
+            self._calls[call_id] = _Call(group_id)
+            self.started += 1
+        self.join(call_id, sid)
+        return call_id
+
+    def group_of(self, call_id):
+        """The group a call belongs to, None if there is no such call"""
+        with self._lock:
+            call = self._calls.get(call_id)
+            return call.group_id if call else None
+
+    def join(self, call_id, sid):
+        """Add sid to a call; returns the sids already in it, or None if there is no such call"""
+        with self._lock:
+            call = self._calls.get(call_id)
+            if call is None:
+                return None
+            peers = sorted(call.participants - {sid})
+            call.participants.add(sid)
+            self._calls_by_sid.setdefault(sid, set()).add(call_id)
+            return peers
+
+    def leave(self, call_id, sid):
+        """Remove sid from a call, ending the call when it is empty; returns whether sid was in it"""
+        with self._lock:
+            call = self._calls.get(call_id)
+            if call is None or sid not in call.participants:
+                return False
+            call.participants.discard(sid)
+            calls = self._calls_by_sid.get(sid, set())
+            calls.discard(call_id)
+            if not calls:
+                self._calls_by_sid.pop(sid, None)
+            if not call.participants:
+                del self._calls[call_id]
+            return True
+
+    def calls_of(self, sid):
+        with self._lock:
+            return list(self._calls_by_sid.get(sid, ()))
+
+    def check_signal(self, call_id, sid, to=None):
+        """Whether sid may signal in a call, to one peer of it if given; counted as relayed or rejected"""
+        with self._lock:
+            call = self._calls.get(call_id)
+            allowed = (call is not None and sid in call.participants
+                       and (to is None or (to in call.participants and to != sid)))
+            if allowed:
+                self.relayed += 1
+            else:
+                self.rejected += 1
+            return allowed
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active_calls": len(self._calls),
+                "participants": sum(len(call.participants) for call in self._calls.values()),
+                "started": self.started,
+                "signals_relayed": self.relayed,
+                "signals_rejected": self.rejected
+            }
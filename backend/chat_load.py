@@ -0,0 +1,79 @@
+"""Chat fan-out load test: per-message cost against room size and total connections.
+
+    python chat_load.py --connections 1000 --room-sizes 1,10,100,1000 --messages 200
+
+Connects in-process Socket.IO test clients to the app and puts room_size of
+them in one study group's room. For each room size it times:
+
+    handler     a member's 'message' event end to end (membership check, emit, enqueue for writing)
+    room        the server emitting one message to the room
+    broadcast   the server emitting one message to every connection, as chat used to
+
+room and handler cost should follow room size, broadcast the total
+connections. A throwaway group and its messages are written to the
+configured database and removed afterwards.
+"""
+import argparse
+import json
+import time
+from app import app, socketio, groups_collection, chat_buckets_collection, chat_writer
+from bench import summarize
+
+def drain(clients):
+    for client in clients:
+        client.get_received()
+
+def timed(fn, count, clients):
+    latencies = []
+    for i in range(count):
+        started = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - started)
+        drain(clients)
+    return latencies
+
+def run(connections, room_sizes, messages):
+    group_object_id = groups_collection.insert_one({
+        "name": "chat_load", "department": "LOAD", "course_number": "0000", "description": "chat_load.py"
+    }).inserted_id
+    group_id = str(group_object_id)
+    clients = [socketio.test_client(app) for _ in range(connections)]
+    results = []
+    try:
+        members = 0
+        for room_size in sorted(room_sizes):
+            # Grow the room to room_size; everyone else stays connected outside it
+            for client in clients[members:room_size]:
+                client.emit('join', {"group_id": group_id})
+            members = room_size
+            drain(clients)
+
+            sender = clients[0]
+            payload = {"group_id": group_id, "username": "load", "text": "hello"}
+            cases = {
+                'handler': lambda i: sender.emit('message', dict(payload, text=f"hello {i}")),
+                'room': lambda i: socketio.emit('message', payload, to=group_id),
+                'broadcast': lambda i: socketio.emit('message', payload)
+            }
+            for case, fn in cases.items():
+                latencies = timed(fn, messages, clients)
+                results.append(summarize(latencies, case=case, connections=connections, room_size=room_size))
+                print(json.dumps(results[-1]))
+    finally:
+        for client in clients:
+            client.disconnect()
+        # Write out the queued messages so they are deleted below rather than after
+        chat_writer.close()
+        groups_collection.delete_one({'_id': group_object_id})
+        chat_buckets_collection.delete_many({'group_id': group_id})
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time chat fan-out against room size")
+    parser.add_argument('--connections', type=int, default=1000, help="total connected clients")
+    parser.add_argument('--room-sizes', default='1,10,100,1000', help="comma-separated room sizes to test")
+    parser.add_argument('--messages', type=int, default=200, help="messages timed per case")
+    args = parser.parse_args()
+
+    sizes = [min(int(size), args.connections) for size in args.room_sizes.split(',')]
+    run(args.connections, sizes, args.messages)
@@ -0,0 +1,170 @@
+"""Chat history stored in the bucket pattern.
+
+Messages live in chat_buckets, one document per group per hour-long window,
+holding up to bucket_size messages and bucket_bytes of them:
+
+    {group_id, start, count, size, first_at, last_at, first_seq, last_seq,
+     messages: [{_id, seq, username, text, created_at}, ...]}
+
+Once a bucket is full, by count or by size, the next message opens another
+one for the same window, so a bucket never nears the 16 MB document limit.
+A group's history for a time range is read from the few buckets whose
+window overlaps it, using the (group_id, start) index; a resync after a
+room sequence number reads the buckets whose last_seq is past it.
+"""
+from datetime import datetime, timezone
+import heapq
+from itertools import groupby
+import bson
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+BUCKET_SECONDS = 3600
+BUCKET_SIZE = 200
+BUCKET_BYTES = 4 * 1024 * 1024
+# Write error codes that mean the server was unavailable (failover, shutdown, network),
+# so the message may succeed if retried; any other write error rejects the message for good
+TRANSIENT_WRITE_CODES = {6, 7, 89, 91, 189, 262, 9001, 10107, 11600, 11602, 13435, 13436}
+
+def _utc(value):
+    # PyMongo decodes naive datetimes that are UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def window_start(created_at):
+    """Start of the bucket window holding a message created at created_at"""
+    timestamp = _utc(created_at).timestamp()
+    return datetime.fromtimestamp(timestamp - timestamp % BUCKET_SECONDS, timezone.utc)
+
+# Bucket queries as (filter, sort), shared with the query-plan check in indexes.py
+
+def history_query(group_id=None, since=None, until=None):
+    """Buckets of a group (or every group) whose window overlaps [since, until)"""
+    query = {} if group_id is None else {'group_id': group_id}
+    start_range = {}
+    if since is not None:
+        start_range['$gte'] = window_start(since)
+    if until is not None:
+        start_range['$lt'] = until
+    if start_range:
+        query['start'] = start_range
+    # Sorted on start alone so the (group_id, start) or (start) index provides the order
+    return query, [('start', 1)]
+
+def last_seq_query(group_id):
+    """The group's bucket with the highest sequence number first"""
+    return {'group_id': group_id, 'last_seq': {'$exists': True}}, [('last_seq', -1)]
+
+def after_seq_query(group_id, after_seq, before_seq=None):
+    """A group's buckets holding a seq in (after_seq, before_seq)"""
+    query = {'group_id': group_id, 'last_seq': {'$gt': after_seq}}
+    if before_seq is not None:
+        query['first_seq'] = {'$lt': before_seq}
+    return query, [('last_seq', 1)]
+
+class ChatBuckets:
+    def __init__(self, collection, bucket_size=BUCKET_SIZE, bucket_bytes=BUCKET_BYTES):
+        self.collection = collection
+        self.bucket_size = bucket_size
+        self.bucket_bytes = bucket_bytes
+
+    def _append_op(self, message):
+        """Upsert pushing a message onto the open bucket of its group and window.
+
+        message needs group_id and created_at; it is given an _id if it has none,
+        so ids can serve as history cursors.
+        """
+        message.setdefault('_id', ObjectId())
+        entry = {key: value for key, value in message.items() if key != 'group_id'}
+        entry_bytes = len(bson.encode(entry))
+        created_at = message['created_at']
+        bounds = {'$min': {'first_at': created_at}, '$max': {'last_at': created_at}}
+        if 'seq' in message:
+            bounds['$min']['first_seq'] = message['seq']
+            bounds['$max']['last_seq'] = message['seq']
+        return UpdateOne(
+            {
+                'group_id': message.get('group_id'),
+                'start': window_start(created_at),
+                'count': {'$lt': self.bucket_size},
+                # Room left for this message; buckets from before size was tracked are closed
+                'size': {'$lte': self.bucket_bytes - entry_bytes}
+            },
+            {
+                '$push': {'messages': entry},
+                '$inc': {'count': 1, 'size': entry_bytes},
+                **bounds
+            },
+            upsert=True
+        )
+
+    def append(self, message):
+        self.collection.bulk_write([self._append_op(message)])
+
+    def append_many(self, messages):
+        """Append messages in order in one bulk write.
+
+        Returns (unwritten, rejected): the tail still to write, worth retrying,
+        and any message the server refused for good (too large, invalid).
+        """
+        if not messages:
+            return [], []
+        try:
+            # Ordered, so a failure leaves exactly the messages from the failed one onwards
+            self.collection.bulk_write([self._append_op(message) for message in messages], ordered=True)
+            return [], []
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            if not errors:
+                return [], []
+            index = errors[0]['index']
+            print(f"Error appending chat messages: {errors[0].get('code')} {errors[0].get('errmsg')}")
+            if errors[0].get('code') in TRANSIENT_WRITE_CODES:
+                return messages[index:], []
+            return messages[index + 1:], [messages[index]]
+
+    def history(self, group_id=None, since=None, until=None, after=None):
+        """Yield messages in time order, each with its group_id.
+
+        group_id None reads every group. since/until bound created_at; after is the
+        _id of the last message already seen.
+        """
+        if after is not None:
+            since = max(_utc(since), after.generation_time) if since else after.generation_time
+        query, sort = history_query(group_id, since, until)
+        # Buckets sharing a window (several groups, or a group's overflow) are merged by time
+        buckets = self.collection.find(query).sort(sort)
+        for _, window in groupby(buckets, key=lambda bucket: bucket['start']):
+            streams = [[dict(message, group_id=bucket['group_id']) for message in bucket['messages']]
+                       for bucket in window]
+            for message in heapq.merge(*streams, key=lambda message: (message['created_at'], message['_id'])):
+                created_at = _utc(message['created_at'])
+                if since is not None and created_at < _utc(since):
+                    continue
+                if until is not None and created_at >= _utc(until):
+                    return
+                if after is not None and message['_id'] <= after:
+                    continue
+                yield message
+
+    def last_seq(self, group_id):
+        """Highest stored sequence number of a group's room, 0 if none"""
+        query, sort = last_seq_query(group_id)
+        bucket = self.collection.find_one(query, {'last_seq': 1}, sort=sort)
+        return bucket['last_seq'] if bucket else 0
+
+    def after_seq(self, group_id, after_seq, before_seq=None, limit=None):
+        """A group's stored messages with after_seq < seq (< before_seq), in seq order"""
+        query, sort = after_seq_query(group_id, after_seq, before_seq)
+        messages = []
+        for bucket in self.collection.find(query).sort(sort):
+            if limit is not None and len(messages) >= limit:
+                # Keep only the first limit; stop once no later bucket can hold an earlier seq
+                messages.sort(key=lambda message: message['seq'])
+                del messages[limit:]
+                if bucket['first_seq'] > messages[-1]['seq']:
+                    break
+            messages.extend(dict(message, group_id=group_id) for message in bucket['messages']
+                            if after_seq < message.get('seq', 0) and (before_seq is None or message['seq'] < before_seq))
+        messages.sort(key=lambda message: message['seq'])
+        return messages[:limit] if limit is not None else messages
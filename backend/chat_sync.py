@@ -0,0 +1,109 @@
+"""Per-room sequence numbers and a ring buffer of recent messages for reconnect resync.
+
+Every message sent to a group's room is stamped with the room's next seq
+(1, 2, 3, ...), which is stored with it and sent to members. A client that
+reconnects asks for the messages after the last seq it saw, over
+GET /api/chats?group_id=...&after_seq=N or the 'sync' socket event, and gets
+only the gap.
+
+The last ring_size messages of each room are kept in memory, so a resync
+whose gap starts inside that window needs no database read; older gaps are
+read from chat_buckets by seq, plus whatever the ring still holds. Messages
+the write-behind buffer has not yet settled (written or given up on) are
+never evicted, however deep its queue, so everything older than the ring
+can be read from the store. A room's counter starts from its highest stored
+seq the first time this process sees it. The counters live in this process,
+like the Socket.IO rooms themselves, so all of a room's senders must be
+served by the same process.
+"""
+from collections import deque
+import threading
+
+RING_SIZE = 500
+
+class _Room:
+    def __init__(self, last_seq):
+        self.seq = last_seq
+        self.ring = deque()  # Contiguous run of the newest messages, oldest first
+        self.unsettled = set()  # _ids of ring messages the writer has not settled yet
+
+class RoomLog:
+    def __init__(self, store, ring_size=RING_SIZE):
+        self.store = store  # last_seq(group_id) and after_seq(group_id, after_seq, before_seq, limit)
+        self.ring_size = ring_size
+        self._rooms = {}  # group_id -> _Room
+        # Only held for in-memory updates, never across a database read
+        self._lock = threading.Lock()
+        self.ring_hits = 0
+        self.store_reads = 0
+
+    def _room(self, group_id):
+        room = self._rooms.get(group_id)
+        if room is None:
+            last_seq = self.store.last_seq(group_id)
+            with self._lock:
+                # Another sender may have seeded the room meanwhile; the first one wins
+                room = self._rooms.setdefault(group_id, _Room(last_seq))
+        return room
+
+    def _trim(self, room):
+        # Past ring_size, drop the oldest messages, but only those already settled
+        while len(room.ring) > self.ring_size and room.ring[0]['_id'] not in room.unsettled:
+            room.ring.popleft()
+
+    def known(self, group_id):
+        """Whether the room's counter is already in memory"""
+        return group_id in self._rooms
+
+    def stamp(self, message):
+        """Give a message its room's next seq and keep it in the ring; returns the seq"""
+        room = self._room(message['group_id'])
+        with self._lock:
+            room.seq += 1
+            message['seq'] = room.seq
+            room.ring.append(message)
+            room.unsettled.add(message['_id'])
+            self._trim(room)
+        return room.seq
+
+    def settled(self, messages):
+        """The writer is done with these messages: they may now leave the ring"""
+        with self._lock:
+            for message in messages:
+                room = self._rooms.get(message['group_id'])
+                if room is not None:
+                    room.unsettled.discard(message['_id'])
+                    self._trim(room)
+
+    def last_seq(self, group_id):
+        return self._room(group_id).seq
+
+    def after(self, group_id, after_seq, limit=None):
+        """A room's messages with seq > after_seq in seq order, from memory when the ring covers them"""
+        room = self._room(group_id)
+        with self._lock:
+            ring = list(room.ring)
+        recent = [message for message in ring if message['seq'] > after_seq]
+        if not ring or ring[0]['seq'] > after_seq + 1:
+            # The gap starts before the ring: read the older part from the store
+            with self._lock:
+                self.store_reads += 1
+            older = self.store.after_seq(group_id, after_seq, ring[0]['seq'] if ring else None, limit)
+            recent = older + recent
+        else:
+            with self._lock:
+                self.ring_hits += 1
+        return recent[:limit] if limit is not None else recent
+
+    def stats(self):
+        with self._lock:
+            resyncs = self.ring_hits + self.store_reads
+            return {
+                "rooms": len(self._rooms),
+                "ring_size": self.ring_size,
+                "buffered": sum(len(room.ring) for room in self._rooms.values()),
+                "unsettled": sum(len(room.unsettled) for room in self._rooms.values()),
+                "ring_hits": self.ring_hits,
+                "store_reads": self.store_reads,
+                "ring_hit_rate": round(self.ring_hits / resyncs, 3) if resyncs else None
+            }
@@ -0,0 +1,197 @@
+"""Write-behind persistence for chat messages.
+
+The Socket.IO handler emits a message first and then hands it to write(),
+which only enqueues it. A background task drains the queue into batches for
+the store's append_many (one bulk write each), flushing when a batch reaches
+max_batch messages or flush_interval seconds after its first message. New messages are visible to GET /api/chats
+after at most about flush_interval.
+
+The queue is bounded. When it is full, write() waits up to enqueue_timeout
+for room and then falls back to a synchronous store.append, so a slow database
+slows senders down instead of losing messages. A batch that still fails after
+its retries (a network error or failover) is held and retried ahead of
+everything queued behind it, so the queue fills and that backpressure reaches
+the senders. A message the database refuses for good (too large, invalid) is
+logged, counted as dropped and skipped, so it can't hold up the rest.
+close() flushes everything still held or queued; app.py calls it at shutdown,
+and only what fails then is dropped. A batch retried after a network error,
+rather than a write error, may append some messages twice. on_settled, if
+given, is called with messages once they are written or dropped.
+
+The queue, background task and sleep come from the Socket.IO server so they
+are green under eventlet and OS threads otherwise.
+"""
+import queue
+import threading
+import time
+from pymongo.errors import PyMongoError
+
+class WriteBehindBuffer:
+    def __init__(self, store, create_queue, start_task, sleep=time.sleep, max_batch=100,
+                 flush_interval=0.2, max_queue=10000, enqueue_timeout=1.0, retries=3, on_settled=None):
+        self.store = store  # append(message) and append_many(messages) -> (unwritten, rejected)
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.enqueue_timeout = enqueue_timeout
+        self.retries = retries
+        self.on_settled = on_settled
+        self._queue = create_queue(max_queue)
+        self._start_task = start_task
+        self._sleep = sleep
+        self._running = False
+        self._closed = False
+        self._held = []  # Unwritten tail of a failed batch, retried before anything else
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.sync_writes = 0
+        self.requeued = 0
+        self.dropped = 0
+        self.task_errors = 0
+        self.flush_ms_total = 0.0
+        self.flush_ms_max = 0.0
+
+    def write(self, doc):
+        """Queue a message for the store, or write it now if the buffer is full or closed"""
+        if not self._closed:
+            self._ensure_started()
+            try:
+                self._queue.put(doc, timeout=self.enqueue_timeout)
+                with self._lock:
+                    self.enqueued += 1
+                return
+            except queue.Full:
+                pass
+        # Backpressure: the caller pays the round trip itself
+        try:
+            self.store.append(doc)
+        finally:
+            self._settled([doc])
+        with self._lock:
+            self.sync_writes += 1
+
+    def _settled(self, messages):
+        if messages and self.on_settled is not None:
+            self.on_settled(messages)
+
+    def _ensure_started(self):
+        """Start the background task, or restart it if it has died"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        self._start_task(self._run)
+
+    def _next_batch(self):
+        """Block for a first message, then collect until max_batch or flush_interval after it"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        """Everything currently queued, without waiting"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _flush(self, batch):
+        """Write a batch with retries; returns the messages still unwritten"""
+        started = time.perf_counter()
+        pending = batch
+        rejected = 0
+        attempt = 0
+        while pending and attempt < self.retries:
+            try:
+                # Only the unwritten tail of an ordered write comes back for a retry
+                pending, refused = self.store.append_many(pending)
+            except PyMongoError as e:
+                print(f"Error writing {len(pending)} chat messages (attempt {attempt + 1}): {e}")
+                refused = []
+            if refused:
+                # Refused for good (too large, invalid): dropped, and the rest is written straight away
+                rejected += len(refused)
+                continue
+            if pending:
+                self._sleep(0.1 * 2 ** attempt)
+                attempt += 1
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.written += len(batch) - len(pending) - rejected
+            self.dropped += rejected
+            self.requeued += len(pending)
+            self.batches += 1
+            self.flush_ms_total += elapsed_ms
+            self.flush_ms_max = max(self.flush_ms_max, elapsed_ms)
+        self._settled(batch[:len(batch) - len(pending)])
+        return pending
+
+    def _run(self):
+        try:
+            while not self._closed:
+                batch = []
+                try:
+                    # Nothing new is taken while a failed batch is held, keeping messages in order
+                    batch = self._held or self._next_batch()
+                    self._held = self._flush(batch) if batch else []
+                except Exception as e:
+                    # Not a database error, so retrying won't help; drop the batch rather than stall on it
+                    print(f"Error in chat writer, dropping {len(batch)} messages: {e}")
+                    with self._lock:
+                        self.task_errors += 1
+                        self.dropped += len(batch)
+                    self._held = []
+                    self._settled(batch)
+        finally:
+            with self._lock:
+                self._running = False
+
+    def close(self, timeout=5.0):
+        """Stop taking new messages into the queue and write out everything still in it"""
+        self._closed = True
+        # Let the background task finish the batch it is holding
+        deadline = time.monotonic() + self.flush_interval + timeout
+        while self._running and time.monotonic() < deadline:
+            self._sleep(0.05)
+        batch = self._held + self._drain()
+        self._held = []
+        for start in range(0, len(batch), self.max_batch):
+            unwritten = self._flush(batch[start:start + self.max_batch])
+            if unwritten:
+                print(f"Dropping {len(unwritten)} chat messages that could not be written at shutdown")
+                with self._lock:
+                    self.dropped += len(unwritten)
+                self._settled(unwritten)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "held": len(self._held),
+                "max_queue": self.max_queue,
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "batches": self.batches,
+                "sync_writes": self.sync_writes,
+                "requeued": self.requeued,
+                "dropped": self.dropped,
+                "task_errors": self.task_errors,
+                "flush_ms_avg": round(self.flush_ms_total / self.batches, 3) if self.batches else None,
+                "flush_ms_max": round(self.flush_ms_max, 3)
+            }
@@ -0,0 +1,121 @@
+"""Columnar profile store for matching one profile against many in a single vectorized pass"""
+from collections import namedtuple
+import numpy as np
+from models import MAX_MATCH_DISTANCE, MIN_OVERLAP_HOURS
+from availability import to_bytes, SLOT_BYTES
+
+Match = namedtuple('Match', ['profile', 'distance', 'matched_subjects', 'matched_availability', 'overlap_hours'])
+
+class Vocabulary:
+    """Interns tokens to consecutive bit positions"""
+    def __init__(self):
+        self.positions = {}
+
+    def intern(self, token):
+        return self.positions.setdefault(token, len(self.positions))
+
+    def __len__(self):
+        return len(self.positions)
+
+    def words(self):
+        """Number of uint64 words needed for a bitset over this vocabulary"""
+        return max(1, (len(self.positions) + 63) // 64)
+
+class ProfileStore:
+    """Profiles held as columns: lat/lon arrays, subject bitsets, availability slot
+    bitmaps and bitsets of free-text availability tokens"""
+    def __init__(self, profiles=()):
+        self.profiles = []
+        self.subjects = Vocabulary()
+        self.free_text = Vocabulary()
+        self._columns = None
+        for profile in profiles:
+            self.add(profile)
+
+    def add(self, profile):
+        self.profiles.append(profile)
+        for token in profile.subjects:
+            self.subjects.intern(token)
+        for token in profile.unparsed_availability:
+            self.free_text.intern(token)
+        self._columns = None
+
+    def __len__(self):
+        return len(self.profiles)
+
+    @staticmethod
+    def _point(profile):
+        location = profile.location
+        if isinstance(location, dict) and isinstance(location.get('lat'), float) \
+                and isinstance(location.get('lon'), float):
+            return location['lat'], location['lon']
+        # Same as calculate_distance: a profile without a usable location is infinitely far away
+        return np.inf, np.inf
+
+    @staticmethod
+    def _bitsets(token_lists, vocab):
+        bits = np.zeros((len(token_lists), vocab.words()), dtype=np.uint64)
+        for row, tokens in enumerate(token_lists):
+            for token in tokens:
+                position = vocab.positions[token]
+                bits[row, position // 64] |= np.uint64(1 << (position % 64))
+        return bits
+
+    def columns(self):
+        """Build (lat, lon, subject_bits, slots, free_text_bits), cached until the next add"""
+        if self._columns is None:
+            points = np.array([self._point(p) for p in self.profiles], dtype=np.float64).reshape(-1, 2)
+            slots = np.frombuffer(b''.join(to_bytes(p.availability_slots) for p in self.profiles),
+                                  dtype=np.uint8).reshape(-1, SLOT_BYTES)
+            self._columns = (
+                points[:, 0],
+                points[:, 1],
+                self._bitsets([p.subjects for p in self.profiles], self.subjects),
+                slots,
+                self._bitsets([p.unparsed_availability for p in self.profiles], self.free_text)
+            )
+        return self._columns
+
+    @staticmethod
+    def _overlap(bits, tokens, vocab):
+        """Return (row mask of any overlap, per-token membership matrix) for the query tokens"""
+        known = [token for token in dict.fromkeys(tokens) if token in vocab.positions]
+        membership = np.zeros((bits.shape[0], len(known)), dtype=bool)
+        for column, token in enumerate(known):
+            position = vocab.positions[token]
+            membership[:, column] = (bits[:, position // 64] >> np.uint64(position % 64)) & np.uint64(1)
+        return membership.any(axis=1), membership, known
+
+    def find_matches(self, source, max_distance=MAX_MATCH_DISTANCE, min_overlap=MIN_OVERLAP_HOURS):
+        """Match source against every stored profile, with the same result as find_match"""
+        if not self.profiles:
+            return []
+        lat, lon, subject_bits, slots, free_text_bits = self.columns()
+
+        subject_mask, subject_members, subject_tokens = self._overlap(
+            subject_bits, source.subjects, self.subjects)
+        source_slots = np.frombuffer(to_bytes(source.availability_slots), dtype=np.uint8)
+        overlap_hours = np.unpackbits(slots & source_slots, axis=1).sum(axis=1)
+        free_text_mask = self._overlap(free_text_bits, source.unparsed_availability, self.free_text)[0]
+        availability_mask = (overlap_hours >= min_overlap) | free_text_mask
+
+        source_lat, source_lon = self._point(source)
+        with np.errstate(invalid='ignore'):
+            distances = np.sqrt((lat - source_lat) ** 2 + (lon - source_lon) ** 2)
+        distances[np.isnan(distances)] = np.inf
+
+        matched = np.flatnonzero(subject_mask & availability_mask & (distances <= max_distance))
+        return [
+            Match(
+                self.profiles[row],
+                float(distances[row]),
+                [token for token, hit in zip(subject_tokens, subject_members[row]) if hit],
+                source.matched_availability(self.profiles[row]),
+                int(overlap_hours[row])
+            )
+            for row in matched
+        ]
+
+def find_matches(source, candidates, max_distance=MAX_MATCH_DISTANCE, min_overlap=MIN_OVERLAP_HOURS):
+    """Batch version of find_match: every candidate that matches source, with distances and overlaps"""
+    return ProfileStore(candidates).find_matches(source, max_distance, min_overlap)
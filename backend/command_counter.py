@@ -0,0 +1,33 @@
+"""Count of MongoDB commands issued per request, via pymongo.monitoring.
+
+Every response carries the count for its request in X-Mongo-Commands, so a
+handler's round-trip budget can be checked from the outside. For streamed
+responses it covers the commands issued before streaming started.
+"""
+import threading
+from flask import g, has_app_context
+from pymongo import monitoring
+
+COMMAND_COUNT_HEADER = 'X-Mongo-Commands'
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total = 0
+
+    def started(self, event):
+        # Listeners run synchronously on the thread (or green thread) issuing the command
+        with self._lock:
+            self.total += 1
+        if has_app_context():
+            g.mongo_commands = g.get('mongo_commands', 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+def commands_issued():
+    """Commands issued so far in the current request"""
+    return g.get('mongo_commands', 0)
@@ -0,0 +1,152 @@
+"""Streaming collection export to NDJSON or CSV, optionally gzip-compressed.
+
+    python export.py chat_buckets --since 2024-09-01 --gzip -o chat_buckets.ndjson.gz
+    python export.py users --fields name,subjects --batch-size 5000 > users.ndjson
+    GET /api/export/<collection>?format=csv&fields=...&since=...&until=...&gzip=1
+
+Documents are encoded as the cursor yields them and written out in ~64 KB
+chunks, so memory stays constant whatever the collection size. The date
+range is on _id creation time, which every collection has.
+"""
+import argparse
+import csv
+from datetime import datetime, timezone
+import io
+import json
+import sys
+import time
+import zlib
+from bson import ObjectId
+from serialization import json_view, dumps
+
+EXPORT_COLLECTIONS = ('users', 'groups', 'meetings', 'chats', 'chat_buckets')
+# Never exported: login account credentials and contact details, and the internal availability fields
+EXCLUDED_FIELDS = {'users': ('password', 'email', 'username', 'availability_slots', 'availability_days')}
+# Only these documents are exported: users holds login accounts as well as profiles
+EXPORT_FILTERS = {'users': {'subjects': {'$exists': True}}}
+# CSV columns when no fields are asked for; other collections take the first document's keys
+CSV_COLUMNS = {'users': ['_id', 'name', 'subjects', 'availability', 'location']}
+DEFAULT_BATCH_SIZE = 1000
+CHUNK_BYTES = 64 * 1024
+
+def parse_date(value):
+    """ISO 8601 date or datetime, taken as UTC if it has no offset; raises ValueError"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date: {value}")
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def export_query(since=None, until=None, collection_name=None):
+    """Query selecting the collection's exportable documents created in [since, until)"""
+    query = dict(EXPORT_FILTERS.get(collection_name, {}))
+    id_range = {}
+    if since is not None:
+        id_range['$gte'] = ObjectId.from_datetime(since)
+    if until is not None:
+        id_range['$lt'] = ObjectId.from_datetime(until)
+    if id_range:
+        query['_id'] = id_range
+    return query
+
+def export_projection(collection_name, fields=None):
+    """Inclusion projection for the requested fields, else exclude the collection's private fields"""
+    excluded = EXCLUDED_FIELDS.get(collection_name, ())
+    if fields:
+        hidden = [field for field in fields if field in excluded]
+        if hidden:
+            raise ValueError(f"Fields not exportable: {', '.join(hidden)}")
+        return dict.fromkeys(['_id', *fields], 1)
+    return dict.fromkeys(excluded, 0) or None
+
+def _ndjson_rows(docs):
+    for doc in docs:
+        yield dumps(doc) + '\n'
+
+def _csv_cell(value):
+    return dumps(value) if isinstance(value, (dict, list)) else value
+
+def _csv_rows(docs, columns=None):
+    """CSV lines; without columns they are the keys of the first document"""
+    buffer = io.StringIO()
+    writer = None
+    for doc in docs:
+        if writer is None:
+            columns = columns or list(doc)
+            writer = csv.DictWriter(buffer, columns, extrasaction='ignore')
+            writer.writeheader()
+        writer.writerow({key: _csv_cell(value) for key, value in doc.items()})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+class ExportStats:
+    def __init__(self):
+        self.rows = 0
+        self.started = time.perf_counter()
+
+    def to_json(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "rows": self.rows,
+            "elapsed_s": round(elapsed, 3),
+            "rows_per_s": round(self.rows / elapsed, 1) if elapsed else None
+        }
+
+def export_chunks(collection, fmt='ndjson', query=None, projection=None, fields=None,
+                  batch_size=DEFAULT_BATCH_SIZE, compress=False, stats=None):
+    """Yield the export as bytes chunks; stats, if given, is updated as rows are read"""
+    stats = stats if stats is not None else ExportStats()
+    cursor = json_view(collection).find(query or {}, projection).sort('_id', 1).batch_size(batch_size)
+
+    def counted(docs):
+        for doc in docs:
+            stats.rows += 1
+            yield doc
+
+    columns = ['_id', *fields] if fields else CSV_COLUMNS.get(collection.name)
+    rows = _csv_rows(counted(cursor), columns) if fmt == 'csv' else _ndjson_rows(counted(cursor))
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 writes a gzip header
+
+    pending = []
+    size = 0
+    for row in rows:
+        pending.append(row)
+        size += len(row)
+        if size >= CHUNK_BYTES:
+            data = ''.join(pending).encode('utf-8')
+            pending, size = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = ''.join(pending).encode('utf-8')
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a collection to NDJSON or CSV")
+    parser.add_argument('collection', choices=EXPORT_COLLECTIONS)
+    parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson')
+    parser.add_argument('--fields', help="comma-separated fields to export (default: all public fields)")
+    parser.add_argument('--since', type=parse_date, help="only documents created at or after this date")
+    parser.add_argument('--until', type=parse_date, help="only documents created before this date")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--gzip', action='store_true', help="gzip the output")
+    parser.add_argument('-o', '--output', help="write here instead of stdout")
+    args = parser.parse_args()
+
+    from app import db
+    fields = [field.strip() for field in args.fields.split(',') if field.strip()] if args.fields else None
+    try:
+        projection = export_projection(args.collection, fields)
+    except ValueError as e:
+        parser.error(str(e))
+    stats = ExportStats()
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    with out:
+        for chunk in export_chunks(db[args.collection], args.format, export_query(args.since, args.until, args.collection),
+                                   projection, fields, args.batch_size, args.gzip, stats):
+            out.write(chunk)
+    print(json.dumps(stats.to_json()), file=sys.stderr)
@@ -0,0 +1,150 @@
+"""Declarative MongoDB index registry.
+
+    python indexes.py           create any missing indexes (idempotent)
+    python indexes.py --check   explain each endpoint query and fail on a COLLSCAN or blocking SORT
+
+ensure_indexes(db) is also run when app.py starts.
+"""
+import argparse
+from datetime import datetime, timezone
+import sys
+from bson import ObjectId
+from pymongo import ASCENDING, GEO2D, IndexModel
+from pymongo.errors import OperationFailure
+
+# collection name -> indexes it must have
+INDEXES = {
+    'users': [
+        # Login accounts have a username, student profiles don't
+        IndexModel([('username', ASCENDING)], unique=True, sparse=True),
+        IndexModel([('subjects', ASCENDING)]),
+        IndexModel([('availability', ASCENDING)]),
+        IndexModel([('availability_days', ASCENDING)]),
+        # Planar 2d rather than 2dsphere: matching uses $geoWithin/$center over
+        # {lat, lon} in degrees, the same flat distance as Profile.calculate_distance
+        IndexModel([('location', GEO2D)])
+    ],
+    'groups': [
+        IndexModel([('department', ASCENDING), ('course_number', ASCENDING)])
+    ],
+    'chat_buckets': [
+        IndexModel([('group_id', ASCENDING), ('start', ASCENDING)]),
+        IndexModel([('start', ASCENDING)]),
+        # Reconnect resync: buckets of a room past a sequence number
+        IndexModel([('group_id', ASCENDING), ('last_seq', ASCENDING)])
+    ],
+    'matches': [
+        IndexModel([('profile_id', ASCENDING), ('distance', ASCENDING)]),
+        IndexModel([('run_id', ASCENDING)])
+    ]
+}
+
+def ensure_indexes(db):
+    """Create every registered index; returns the names of collections that failed"""
+    failed = []
+    for collection_name, indexes in INDEXES.items():
+        try:
+            db[collection_name].create_indexes(indexes)
+        except OperationFailure as e:
+            print(f"Error creating indexes on {collection_name}: {e}")
+            failed.append(collection_name)
+    return failed
+
+def has_unique_index(collection, field):
+    """Whether the collection has a unique index on exactly this field"""
+    return any(index.get('unique') and [key for key, _ in index['key']] == [field]
+               for index in collection.index_information().values())
+
+# The queries below are built with the same helpers the routes use, from sample values
+
+def _sample_profile():
+    from models import Profile
+    return Profile('explain', ['math'], ['monday 9-11', 'anytime'], {'lat': 33.2, 'lon': -97.1})
+
+def _sample_candidates():
+    # Shape of the filter from a built ProfileIndex/ProfileLSH
+    from inverted_index import candidate_filter
+    return candidate_filter([str(ObjectId())], ObjectId())
+
+def _match_query():
+    from models import match_pipeline
+    return match_pipeline(_sample_profile(), exclude_id=ObjectId(), candidate_filter=_sample_candidates())
+
+def _search_query(subjects, availability, narrowed=True):
+    from models import Profile, search_query
+    wanted = Profile(None, subjects, availability, None)
+    return search_query(wanted, _sample_candidates() if narrowed else None), None
+
+def _page_query(query=None):
+    from pagination import page_query
+    return page_query(query, ObjectId())
+
+def _chat_query(builder, *args):
+    import chat_store
+    return getattr(chat_store, builder)(*args)
+
+# Query each endpoint runs: name -> (collection, kind, spec)
+QUERY_PLANS = {
+    'signup/login username lookup': ('users', 'find', lambda: ({'username': 'explain'}, None)),
+    'profile by id': ('users', 'find', lambda: ({'_id': ObjectId()}, None)),
+    'profile list page': ('users', 'find', lambda: _page_query({'subjects': {'$exists': True}})),
+    'profile search by subject': ('users', 'find', lambda: _search_query(['math'], [])),
+    'profile search by availability': ('users', 'find', lambda: _search_query([], ['monday 9-11', 'anytime'])),
+    'profile search by subject and availability': ('users', 'find', lambda: _search_query(['math'], ['monday 9-11'])),
+    # Before the candidate index is built, or with too many candidates to list
+    'profile search by subject, unnarrowed': ('users', 'find', lambda: _search_query(['math'], ['monday 9-11'], False)),
+    'profile search by availability, unnarrowed': ('users', 'find', lambda: _search_query([], ['monday 9-11', 'anytime'], False)),
+    'match aggregation': ('users', 'aggregate', _match_query),
+    'meetings page': ('meetings', 'find', lambda: _page_query()),
+    'groups page': ('groups', 'find', lambda: _page_query()),
+    'group exists (chat join, resync)': ('groups', 'find', lambda: ({'_id': ObjectId()}, None)),
+    'chat history for a group': ('chat_buckets', 'find', lambda: _chat_query('history_query', 'explain')),
+    'chat history for a group since a date': ('chat_buckets', 'find', lambda: _chat_query('history_query', 'explain', datetime.now(timezone.utc))),
+    'chat history': ('chat_buckets', 'find', lambda: _chat_query('history_query')),
+    'chat history since a date': ('chat_buckets', 'find', lambda: _chat_query('history_query', None, datetime.now(timezone.utc))),
+    'chat room last seq': ('chat_buckets', 'find', lambda: _chat_query('last_seq_query', 'explain')),
+    'chat resync after a sequence number': ('chat_buckets', 'find', lambda: _chat_query('after_seq_query', 'explain', 0, 100))
+}
+
+def _stages(plan):
+    """Every stage name anywhere in an explain document"""
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _stages(value)
+
+def explain(db, collection_name, kind, spec):
+    if kind == 'aggregate':
+        return db.command('aggregate', collection_name, pipeline=spec(), explain=True)
+    query, sort = spec()
+    cursor = db[collection_name].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    return cursor.explain()
+
+def check_query_plans(db):
+    """Explain every registered endpoint query; returns the names that scan a collection or sort in memory"""
+    problems = []
+    for name, (collection_name, kind, spec) in QUERY_PLANS.items():
+        stages = set(_stages(explain(db, collection_name, kind, spec)))
+        # SORT is a blocking in-memory sort; an index-provided order has no such stage
+        found = [stage for stage in ('COLLSCAN', 'SORT') if stage in stages]
+        status = '+'.join(found) or 'ok'
+        print(f"{status:13} {name} ({', '.join(sorted(stages))})")
+        if found:
+            problems.append(name)
+    return problems
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create MongoDB indexes or check query plans")
+    parser.add_argument('--check', action='store_true', help="fail if any endpoint query plan has a COLLSCAN or blocking SORT")
+    args = parser.parse_args()
+
+    from app import db
+    if args.check:
+        sys.exit(1 if check_query_plans(db) else 0)
+    sys.exit(1 if ensure_indexes(db) else 0)
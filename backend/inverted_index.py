@@ -0,0 +1,229 @@
+"""In-process inverted index from normalized subject/availability keys to profile ids"""
+from array import array
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta, timezone
+import heapq
+import sys
+import threading
+import time
+from bson import ObjectId
+from models import Profile
+
+# Ids this far before a build started may be missing from it; covers clock skew between writers
+WATERMARK_SLACK = timedelta(minutes=5)
+
+def union(postings):
+    """Merge sorted posting arrays into one sorted, de-duplicated array"""
+    merged = array('I')
+    for ordinal in heapq.merge(*postings):
+        if not merged or merged[-1] != ordinal:
+            merged.append(ordinal)
+    return merged
+
+def intersect(left, right):
+    """Intersect two sorted posting arrays, galloping through the longer one"""
+    if len(left) > len(right):
+        left, right = right, left
+    result = array('I')
+    lo = 0
+    for ordinal in left:
+        lo = bisect_left(right, ordinal, lo)
+        if lo == len(right):
+            break
+        if right[lo] == ordinal:
+            result.append(ordinal)
+    return result
+
+class PostingIndex:
+    """Maps each token to a sorted array('I') of profile ordinals"""
+    def __init__(self, name):
+        self.name = name
+        self.postings = {}
+
+    def add(self, ordinal, tokens):
+        for token in set(tokens):
+            posting = self.postings.setdefault(token, array('I'))
+            if not posting or posting[-1] < ordinal:
+                posting.append(ordinal)
+            else:
+                insort(posting, ordinal)
+
+    def remove(self, ordinal, tokens):
+        for token in set(tokens):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            position = bisect_left(posting, ordinal)
+            if position < len(posting) and posting[position] == ordinal:
+                del posting[position]
+            if not posting:
+                del self.postings[token]
+
+    def lookup(self, tokens):
+        """Ordinals of profiles holding any of the tokens"""
+        return union([self.postings[token] for token in set(tokens) if token in self.postings])
+
+    def stats(self):
+        entries = sum(len(posting) for posting in self.postings.values())
+        size = sys.getsizeof(self.postings) + sum(
+            sys.getsizeof(token) + sys.getsizeof(posting) for token, posting in self.postings.items())
+        return {"tokens": len(self.postings), "entries": entries, "bytes": size}
+
+def candidate_filter(candidates, watermark, max_ids=None):
+    """_id filter for candidates from an index built at watermark, or None to leave all filtering to MongoDB.
+
+    The index is only a hint: profiles inserted since it was built (by any
+    process) are matched by _id range, and queries still apply the real
+    subject/availability filters alongside it.
+    """
+    if watermark is None or (max_ids is not None and len(candidates) > max_ids):
+        return None
+    return {'$or': [{'_id': {'$in': [ObjectId(_id) for _id in candidates]}}, {'_id': {'$gte': watermark}}]}
+
+class RefreshingIndex:
+    """Build-from-the-database lifecycle shared by the in-process profile indexes.
+
+    MongoDB stays the source of truth. build() is called from a background
+    task, off the request path; it indexes every profile the first time and
+    again once the index is older than max_age seconds, so profiles written outside this
+    process's routes (the import CLI, migrate.py, another worker, a direct
+    edit) show up within max_age. Profiles inserted after a build began have
+    _ids at or past its watermark, so callers match those by _id range
+    instead of trusting the index for them. The database scan runs without
+    the lock; writes made meanwhile are replayed onto the new index.
+    """
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.built = False
+        self.built_at = None  # time.monotonic() of the last build
+        self.watermark = None  # None until built
+        self.builds = 0
+        self._pending = None  # writes made during a build, while one is running
+
+    def build(self, collection):
+        """Index every profile in the collection if never built or older than max_age; True if it did"""
+        with self._lock:
+            current = self.built and (self.max_age is None or time.monotonic() - self.built_at < self.max_age)
+            if current or self._pending is not None:
+                return False  # Another caller is rebuilding; the current index serves meanwhile
+            self._pending = []
+        started = time.monotonic()
+        watermark = ObjectId.from_datetime(datetime.now(timezone.utc) - WATERMARK_SLACK)
+        try:
+            docs = collection.find({'subjects': {'$exists': True}}, {'subjects': 1, 'availability': 1})
+            state = self._scan(Profile.from_doc(doc) for doc in docs)
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            self._swap(state)
+            for write, args in self._pending:
+                write(*args)
+            self._pending = None
+            self.built = True
+            self.built_at = started
+            self.watermark = watermark
+            self.builds += 1
+        return True
+
+    def add(self, profile_id, subjects, availability):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((self._add_profile, (profile_id, subjects, availability)))
+            if self.built:
+                self._add_profile(profile_id, subjects, availability)
+
+    def remove(self, profile_id):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((self._remove_profile, (profile_id,)))
+            if self.built:
+                self._remove_profile(profile_id)
+
+    def build_stats(self):
+        return {
+            "built": self.built,
+            "builds": self.builds,
+            "age_s": round(time.monotonic() - self.built_at, 1) if self.built else None,
+            "max_age_s": self.max_age
+        }
+
+class ProfileIndex(RefreshingIndex):
+    """Subject and availability posting lists over users_collection profiles.
+
+    Profiles are numbered with dense ordinals so postings stay compact
+    uint32 arrays; ordinals are mapped back to id strings on lookup.
+    """
+    def __init__(self, max_age=None):
+        super().__init__(max_age)
+        self.subjects = PostingIndex('subjects')
+        self.availability = PostingIndex('availability')
+        self._ordinals = {}  # profile id -> ordinal
+        self._ids = []  # ordinal -> profile id, None once deleted
+        self._tokens = {}  # ordinal -> (subjects, availability) currently indexed
+
+    def _scan(self, profiles):
+        fresh = ProfileIndex()
+        for profile in profiles:
+            fresh._add(profile._id, profile.subjects, profile.availability_keys())
+        return fresh
+
+    def _swap(self, fresh):
+        self.subjects, self.availability = fresh.subjects, fresh.availability
+        self._ordinals, self._ids, self._tokens = fresh._ordinals, fresh._ids, fresh._tokens
+
+    def _add(self, profile_id, subjects, availability):
+        ordinal = self._ordinals.get(profile_id)
+        if ordinal is None:
+            ordinal = len(self._ids)
+            self._ordinals[profile_id] = ordinal
+            self._ids.append(profile_id)
+        self.subjects.add(ordinal, subjects)
+        self.availability.add(ordinal, availability)
+        self._tokens[ordinal] = (list(subjects), list(availability))
+
+    def _remove(self, profile_id):
+        ordinal = self._ordinals.get(profile_id)
+        if ordinal is None or ordinal not in self._tokens:
+            return
+        subjects, availability = self._tokens.pop(ordinal)
+        self.subjects.remove(ordinal, subjects)
+        self.availability.remove(ordinal, availability)
+
+    def _add_profile(self, profile_id, subjects, availability):
+        self._remove(profile_id)
+        self._add(profile_id, subjects, availability)
+
+    def _remove_profile(self, profile_id):
+        self._remove(profile_id)
+        ordinal = self._ordinals.pop(profile_id, None)
+        if ordinal is not None:
+            self._ids[ordinal] = None
+
+    def candidates(self, subjects=None, availability=None):
+        """Ids of profiles sharing any given subject and any given availability key.
+
+        A criterion left as None is not applied; both None returns every profile.
+        """
+        with self._lock:
+            postings = None
+            for index, tokens in ((self.subjects, subjects), (self.availability, availability)):
+                if tokens is None:
+                    continue
+                found = index.lookup(tokens)
+                postings = found if postings is None else intersect(postings, found)
+            if postings is None:
+                return [profile_id for profile_id in self._ids if profile_id is not None]
+            return [self._ids[ordinal] for ordinal in postings]
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.build_stats(),
+                "profiles": len(self._tokens),
+                "subjects": self.subjects.stats(),
+                "availability": self.availability.stats(),
+                "id_map_bytes": sys.getsizeof(self._ordinals) + sys.getsizeof(self._ids)
+            }
@@ -0,0 +1,132 @@
+"""Approximate match candidates from MinHash signatures in LSH buckets.
+
+Each profile's normalized subjects and availability keys are MinHashed and the
+signatures split into bands; profiles landing in the same bucket for some
+band of both fields become candidates. Candidates still go through the
+exact match checks, so approximation can only cost recall, never precision.
+"""
+from collections import defaultdict
+import hashlib
+import time
+import numpy as np
+from inverted_index import RefreshingIndex
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+
+def _token_hash(token):
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=4).digest(), 'little')
+
+class MinHashLSH:
+    """Banded MinHash index over token sets for one field"""
+    def __init__(self, bands=32, rows=2, seed=1):
+        self.bands = bands
+        self.rows = rows
+        rng = np.random.RandomState(seed)
+        # a, b < 2**32 and hashes < 2**32 keep a * h + b inside uint64
+        self._a = rng.randint(1, 1 << 32, size=bands * rows, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=bands * rows, dtype=np.uint64)
+        self.buckets = defaultdict(set)  # hash of (band, row values) -> keys
+        self._keys = {}  # key -> bucket ids it was added under
+
+    def signature(self, tokens):
+        """MinHash signature of a token set, or None for an empty set"""
+        tokens = set(tokens)
+        if not tokens:
+            return None
+        hashes = np.array([_token_hash(token) for token in tokens], dtype=np.uint64)
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME
+        return permuted.min(axis=0)
+
+    def _bucket_ids(self, tokens):
+        signature = self.signature(tokens)
+        if signature is None:
+            return []
+        # Hashed to a plain int to keep buckets small; a collision only adds candidates
+        return [hash((band, signature[band * self.rows:(band + 1) * self.rows].tobytes()))
+                for band in range(self.bands)]
+
+    def add(self, key, tokens):
+        self.remove(key)
+        bucket_ids = self._bucket_ids(tokens)
+        for bucket_id in bucket_ids:
+            self.buckets[bucket_id].add(key)
+        self._keys[key] = bucket_ids
+
+    def remove(self, key):
+        for bucket_id in self._keys.pop(key, []):
+            bucket = self.buckets[bucket_id]
+            bucket.discard(key)
+            if not bucket:
+                del self.buckets[bucket_id]
+
+    def query(self, tokens):
+        """Keys sharing at least one band bucket with the token set"""
+        found = set()
+        for bucket_id in self._bucket_ids(tokens):
+            found |= self.buckets.get(bucket_id, set())
+        return found
+
+    def stats(self):
+        sizes = [len(bucket) for bucket in self.buckets.values()]
+        return {
+            "keys": len(self._keys),
+            "buckets": len(sizes),
+            "largest_bucket": max(sizes, default=0),
+            "bands": self.bands,
+            "rows": self.rows
+        }
+
+# Two rows per band: profiles share a bucket only if two MinHashes agree, which keeps buckets
+# selective; the extra bands win back part of the recall. bench.py reports both as
+# recall and candidate_fraction.
+SUBJECT_BANDS, SUBJECT_ROWS = 64, 2
+AVAILABILITY_BANDS, AVAILABILITY_ROWS = 32, 2
+
+class ProfileLSH(RefreshingIndex):
+    """Subject and availability LSH indexes over profiles, rebuilt like ProfileIndex"""
+    def __init__(self, subject_bands=SUBJECT_BANDS, subject_rows=SUBJECT_ROWS, availability_bands=AVAILABILITY_BANDS,
+                 availability_rows=AVAILABILITY_ROWS, max_age=None):
+        super().__init__(max_age)
+        self._shape = (subject_bands, subject_rows, availability_bands, availability_rows)
+        self.subjects = MinHashLSH(subject_bands, subject_rows, seed=1)
+        self.availability = MinHashLSH(availability_bands, availability_rows, seed=2)
+
+    def _scan(self, profiles):
+        subject_bands, subject_rows, availability_bands, availability_rows = self._shape
+        subjects = MinHashLSH(subject_bands, subject_rows, seed=1)
+        availability = MinHashLSH(availability_bands, availability_rows, seed=2)
+        for profile in profiles:
+            subjects.add(profile._id, profile.subjects)
+            availability.add(profile._id, profile.availability_keys())
+        return subjects, availability
+
+    def _swap(self, state):
+        self.subjects, self.availability = state
+
+    def index_profiles(self, profiles):
+        """Index Profile objects directly, keyed by their _id, instead of reading a collection"""
+        state = self._scan(profiles)
+        with self._lock:
+            self._swap(state)
+            self.built = True
+            self.built_at = time.monotonic()
+
+    def _add_profile(self, key, subjects, availability):
+        self.subjects.add(key, subjects)
+        self.availability.add(key, availability)
+
+    def _remove_profile(self, key):
+        self.subjects.remove(key)
+        self.availability.remove(key)
+
+    def candidates(self, subjects, availability):
+        with self._lock:
+            return self.subjects.query(subjects) & self.availability.query(availability)
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.build_stats(),
+                "subjects": self.subjects.stats(),
+                "availability": self.availability.stats()
+            }
@@ -0,0 +1,100 @@
+"""LRU cache of /api/matches results, invalidated incrementally by profile writes.
+
+Every invalidation bumps a generation counter. A caller reads generation()
+before computing matches and passes it to put(), which drops the result if
+any profile was written meanwhile, so a computation racing a write can't
+cache a stale result. Entries older than max_age seconds, if given, are
+misses, so writes made outside this process reach the results in time.
+"""
+from collections import OrderedDict
+import threading
+import time
+from models import find_match
+
+class MatchCache:
+    def __init__(self, max_entries=1024, max_age=None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries = OrderedDict()  # profile_id -> (source Profile, matches, matched ids, time.monotonic() of put)
+        self._generation = 0  # number of invalidating writes so far
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self.stale_puts = 0
+        self.expirations = 0
+
+    def get(self, profile_id):
+        """Return (source Profile, matches) cached for a profile, or None"""
+        with self._lock:
+            entry = self._entries.get(profile_id)
+            if entry is not None and self.max_age is not None and time.monotonic() - entry[3] >= self.max_age:
+                del self._entries[profile_id]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(profile_id)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def generation(self):
+        """Read before computing matches, for put()"""
+        with self._lock:
+            return self._generation
+
+    def put(self, profile_id, source_profile, matches, generation):
+        """Cache matches computed from a read started at generation, unless a write has happened since"""
+        with self._lock:
+            if generation != self._generation:
+                self.stale_puts += 1
+                return
+            matched_ids = {match['_id'] for match in matches}
+            self._entries[profile_id] = (source_profile, matches, matched_ids, time.monotonic())
+            self._entries.move_to_end(profile_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, profile_id, old_profile=None, new_profile=None):
+        """Drop the entries a write to profile_id could have changed.
+
+        An entry is affected if the old version of the profile was one of its
+        matches, or the new version would now match its source. Pass old_profile
+        for updates and deletes, new_profile for creates and updates.
+        """
+        with self._lock:
+            self._generation += 1
+            stale = [profile_id] if profile_id in self._entries else []
+            for source_id, (source, _, matched_ids, _) in self._entries.items():
+                if source_id == profile_id:
+                    continue
+                if old_profile is not None and profile_id in matched_ids:
+                    stale.append(source_id)
+                elif new_profile is not None and find_match(source, new_profile) == "Matched":
+                    stale.append(source_id)
+            for source_id in stale:
+                del self._entries[source_id]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+                "stale_puts": self.stale_puts,
+                "expirations": self.expirations,
+                "max_age_s": self.max_age
+            }
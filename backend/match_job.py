@@ -0,0 +1,112 @@
+"""Nightly all-pairs matching job: python match_job.py [--workers N] [--shard-size N] [--dry-run]
+
+Profiles are blocked by subject so only pairs sharing a subject are compared
+with find_match, the work is sharded across a process pool, and every match
+is written to the matches collection in both directions for digest emails.
+"""
+import argparse
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, timezone
+from multiprocessing import Pool
+import os
+import time
+from app import users_collection, matches_collection
+from models import Profile, find_match
+
+_profiles = None
+_blocks = None
+
+def _init_worker(profiles, blocks):
+    global _profiles, _blocks
+    _profiles = profiles
+    _blocks = blocks
+
+def _match_shard(shard):
+    """Compare every profile in [start, end) against later profiles sharing a subject"""
+    start, end = shard
+    results = []
+    compared = 0
+    for i in range(start, end):
+        source = _profiles[i]
+        candidates = set()
+        for subject in set(source.subjects):
+            # Blocks are in ascending order, so later profiles are a suffix
+            block = _blocks[subject]
+            candidates.update(block[bisect_right(block, i):])
+        for j in candidates:
+            compared += 1
+            other = _profiles[j]
+            if find_match(source, other) == "Matched":
+                results.append((
+                    i, j,
+                    round(source.calculate_distance(other), 2),
+                    sorted(set(source.subjects) & set(other.subjects)),
+                    source.matched_availability(other)
+                ))
+    return end - start, compared, results
+
+def load_profiles():
+    profiles = [Profile.from_doc(doc) for doc in users_collection.find({'subjects': {'$exists': True}})]
+    blocks = defaultdict(list)
+    for i, profile in enumerate(profiles):
+        for subject in set(profile.subjects):
+            blocks[subject].append(i)
+    return profiles, dict(blocks)
+
+def _match_docs(profiles, results, run_id, created_at):
+    for i, j, distance, matched_subjects, matched_availability in results:
+        for source, other in ((profiles[i], profiles[j]), (profiles[j], profiles[i])):
+            yield {
+                "run_id": run_id,
+                "profile_id": source._id,
+                "match_id": other._id,
+                "name": other.name,
+                "distance": distance,
+                "matched_subjects": matched_subjects,
+                "matched_availability": matched_availability,
+                "created_at": created_at
+            }
+
+def run(workers=None, shard_size=500, dry_run=False, report_every=5.0):
+    started = time.monotonic()
+    profiles, blocks = load_profiles()
+    print(f"Loaded {len(profiles)} profiles in {len(blocks)} subject blocks "
+          f"({time.monotonic() - started:.1f}s)")
+
+    run_id = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    created_at = datetime.now(timezone.utc)
+    shards = [(start, min(start + shard_size, len(profiles))) for start in range(0, len(profiles), shard_size)]
+
+    done = compared = matched = written = 0
+    last_report = time.monotonic()
+    with Pool(workers or os.cpu_count(), initializer=_init_worker, initargs=(profiles, blocks)) as pool:
+        for shard_done, shard_compared, results in pool.imap_unordered(_match_shard, shards):
+            done += shard_done
+            compared += shard_compared
+            matched += len(results)
+            if results and not dry_run:
+                docs = list(_match_docs(profiles, results, run_id, created_at))
+                matches_collection.insert_many(docs, ordered=False)
+                written += len(docs)
+
+            now = time.monotonic()
+            if now - last_report >= report_every or done == len(profiles):
+                elapsed = now - started
+                print(f"{done}/{len(profiles)} profiles, {compared} pairs compared "
+                      f"({compared / elapsed:.0f} pairs/s), {matched} matches, {written} written")
+                last_report = now
+
+    if not dry_run:
+        # Replace the previous run only once this one is fully written
+        matches_collection.delete_many({'run_id': {'$ne': run_id}})
+    print(f"Run {run_id} finished in {time.monotonic() - started:.1f}s")
+    return matched
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute all profile matches into the matches collection")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--shard-size', type=int, default=500, help="source profiles per task")
+    parser.add_argument('--dry-run', action='store_true', help="compute matches without writing them")
+    args = parser.parse_args()
+    run(workers=args.workers, shard_size=args.shard_size, dry_run=args.dry_run)
@@ -0,0 +1,77 @@
+"""One-off data migrations. Run with: python migrate.py <migration>"""
+import sys
+from pymongo import UpdateOne
+from app import users_collection, chats_collection, chat_store
+from models import Profile
+
+def _differs(stored, value):
+    """Whether a stored field needs rewriting; dicts count key order, which the 2d location index depends on"""
+    if isinstance(value, dict):
+        return not isinstance(stored, dict) or list(stored.items()) != list(value.items())
+    return stored != value
+
+def normalize_profiles(batch_size=1000):
+    """Rewrite stored profiles with the lowercase subjects, canonical availability
+    with its slot bitmap and day keys, and {lat, lon} location that Profile produces, so
+    server-side matching sees them"""
+    updates = []
+    updated = 0
+    for doc in users_collection.find({'subjects': {'$exists': True}}):
+        profile = Profile(doc.get('name'), doc.get('subjects'), doc.get('availability'), doc.get('location'))
+        normalized = profile.to_doc()
+        del normalized['name']
+        if any(_differs(doc.get(field), value) for field, value in normalized.items()):
+            updates.append(UpdateOne({'_id': doc['_id']}, {'$set': normalized}))
+        if len(updates) >= batch_size:
+            updated += users_collection.bulk_write(updates, ordered=False).modified_count
+            updates = []
+    if updates:
+        updated += users_collection.bulk_write(updates, ordered=False).modified_count
+    print(f"Normalized {updated} profiles")
+
+def bucket_chats(batch_size=1000):
+    """Move flat chats documents into chat_buckets, oldest first. Each batch is
+    deleted from chats once appended, so an interrupted run can be resumed;
+    messages from before timestamps were recorded take their _id's creation time.
+    Messages the database refuses for good are left in chats and reported"""
+    moved = 0
+    refused = []
+    last_id = None
+    while True:
+        query = {'_id': {'$gt': last_id}} if last_id is not None else {}
+        docs = list(chats_collection.find(query).sort('_id', 1).limit(batch_size))
+        if not docs:
+            break
+        messages = [{
+            '_id': doc['_id'],
+            'group_id': doc.get('group_id'),
+            'username': doc.get('username'),
+            'text': doc.get('text'),
+            'created_at': doc.get('created_at') or doc['_id'].generation_time
+        } for doc in docs]
+        unwritten, rejected = chat_store.append_many(messages)
+        handled = docs[:len(docs) - len(unwritten)]
+        rejected_ids = {message['_id'] for message in rejected}
+        written = [doc['_id'] for doc in handled if doc['_id'] not in rejected_ids]
+        chats_collection.delete_many({'_id': {'$in': written}})
+        moved += len(written)
+        refused.extend(rejected_ids)
+        if unwritten and not rejected:
+            print(f"Stopped after {moved} messages; rerun to continue")
+            sys.exit(1)
+        # Carry on after the last message handled, past any refused one
+        last_id = handled[-1]['_id']
+    print(f"Moved {moved} chat messages into buckets")
+    if refused:
+        print(f"Left {len(refused)} refused messages in chats: {', '.join(str(_id) for _id in refused)}")
+
+MIGRATIONS = {
+    'normalize-profiles': normalize_profiles,
+    'bucket-chats': bucket_chats
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in MIGRATIONS:
+        print(f"Usage: python migrate.py [{'|'.join(MIGRATIONS)}]")
+        sys.exit(1)
+    MIGRATIONS[sys.argv[1]]()
@@ -1,6 +1,11 @@
-from app import users_collection
 from bson import ObjectId
 import math
+from availability import to_bitmap, to_bytes, describe, hours, day_keys
+
+# Profiles further apart than this (in degrees) never match
+MAX_MATCH_DISTANCE = 10
+# Default number of shared free hours a match needs
+MIN_OVERLAP_HOURS = 1
 
 class Profile:
     def __init__(self, name, subjects, availability, location, _id=None):
@@ -8,7 +13,23 @@ class Profile:
         self.name = name
         self.subjects = self._ensure_list(subjects)  # Stored in lowercase
         self.availability = self._ensure_list(availability)  # Stored in lowercase
-        self.location = location
+        # Time-slot tokens are converted to the weekly bitmap and rewritten in canonical form;
+        # anything else is kept as free text
+        self.availability_slots, unparsed = to_bitmap(self.availability)
+        self.unparsed_availability = list(dict.fromkeys(unparsed))
+        self.availability = describe(self.availability_slots) + self.unparsed_availability
+        self.location = self._ensure_location(location)
+
+    @classmethod
+    def from_doc(cls, doc):
+        """Build a Profile from a users_collection document"""
+        return cls(
+            name=doc.get('name'),
+            subjects=doc.get('subjects'),
+            availability=doc.get('availability'),
+            location=doc.get('location'),
+            _id=str(doc['_id']) if '_id' in doc else None
+        )
 
     def _ensure_list(self, field):
         """Convert a field to a list if it's not already one and make it case insensitive"""
@@ -18,6 +39,20 @@ class Profile:
             return [item.strip().lower() for item in field if item.strip()]
         return []
 
+    def _ensure_location(self, location):
+        """Normalize a location to a {'lat', 'lon'} dict of floats, in that key order"""
+        try:
+            return {'lat': float(location['lat']), 'lon': float(location['lon'])}
+        except (KeyError, TypeError, ValueError):
+            return location
+
+    def has_location(self):
+        """True if the location is a normalized point inside the 2d index bounds"""
+        try:
+            return all(-180 <= self.location[key] < 180 for key in ('lat', 'lon'))
+        except (KeyError, TypeError):
+            return False
+
     def _capitalize_list(self, items):
         """Capitalize first letter of each item in the list"""
         return [item.capitalize() for item in items]
@@ -31,8 +66,25 @@ class Profile:
     def match_subjects(self, other_profile):
         return len(set(self.subjects) & set(other_profile.subjects)) > 0
 
-    def match_availability(self, other_profile):
-        return len(set(self.availability) & set(other_profile.availability)) > 0
+    def availability_overlap(self, other_profile):
+        """Number of free hours the two profiles share"""
+        return hours(self.availability_slots & other_profile.availability_slots)
+
+    def match_availability(self, other_profile, min_overlap=MIN_OVERLAP_HOURS):
+        if self.availability_overlap(other_profile) >= min_overlap:
+            return True
+        # Free-text tokens that aren't time slots can only match exactly
+        return len(set(self.unparsed_availability) & set(other_profile.unparsed_availability)) > 0
+
+    def matched_availability(self, other_profile):
+        """Shared availability as canonical slot tokens plus shared free-text tokens"""
+        shared = set(other_profile.unparsed_availability)
+        return describe(self.availability_slots & other_profile.availability_slots) + \
+            [token for token in self.unparsed_availability if token in shared]
+
+    def availability_keys(self):
+        """Coarse keys for indexing availability: the days with free hours, plus free-text tokens"""
+        return day_keys(self.availability_slots) + self.unparsed_availability
 
     def calculate_distance(self, other_profile):
         try:
@@ -41,10 +93,22 @@ class Profile:
         except (KeyError, TypeError):
             return float('inf')
 
-    def match_location(self, other_profile, max_distance=10):
+    def match_location(self, other_profile, max_distance=MAX_MATCH_DISTANCE):
         distance = self.calculate_distance(other_profile)
         return distance <= max_distance
 
+    def to_doc(self):
+        """Return the normalized fields stored in users_collection"""
+        return {
+            'name': self.name,
+            'subjects': self.subjects,
+            'availability': self.availability,
+            'availability_slots': to_bytes(self.availability_slots),
+            # Days with free hours, a multikey index to narrow on before testing the bitmap
+            'availability_days': day_keys(self.availability_slots),
+            'location': self.location
+        }
+
     def to_json(self):
         """Return JSON with capitalized subjects and availability"""
         return {
@@ -55,9 +119,87 @@ class Profile:
             'location': self.location
         }
 
-def find_match(profile1, profile2):
+def nearby_query(profile, max_distance=MAX_MATCH_DISTANCE):
+    """Build a query selecting profiles within max_distance of the given profile.
+
+    Uses the flat 2d index on location, so the radius is the same planar
+    distance as calculate_distance. Returns None if the profile has no usable location.
+    """
+    if not profile.has_location():
+        return None
+    center = [profile.location['lat'], profile.location['lon']]
+    return {'location': {'$geoWithin': {'$center': [center, max_distance]}}}
+
+def availability_filters(profile):
+    """$or clauses selecting profiles that share a free hour or free-text token with profile"""
+    filters = []
+    if profile.availability_slots:
+        # $bitsAnySet can't use an index; the day keys select the candidates it is tested on
+        filters.append({
+            'availability_days': {'$in': day_keys(profile.availability_slots)},
+            'availability_slots': {'$bitsAnySet': to_bytes(profile.availability_slots)}
+        })
+    if profile.unparsed_availability:
+        filters.append({'availability': {'$in': profile.unparsed_availability}})
+    return filters
+
+def search_query(wanted, candidate_filter=None):
+    """/api/profiles/search filter for profiles sharing any wanted subject and any wanted free hour or token"""
+    query = {}
+    if wanted.subjects:
+        query['subjects'] = {'$in': wanted.subjects}
+    if wanted.availability:
+        query['$or'] = availability_filters(wanted)
+    if query and candidate_filter is not None:
+        query['$and'] = [candidate_filter]
+    return query
+
+def match_pipeline(profile, exclude_id=None, max_distance=MAX_MATCH_DISTANCE, candidate_filter=None):
+    """Build an aggregation pipeline that evaluates find_match on the server.
+
+    Candidates are filtered by radius, shared subjects and any shared free hour
+    (a shared day in availability_days, then $bitsAnySet on the stored
+    availability_slots bitmap) or free-text token.
+    Each result carries its distance, matched subjects and availability_slots,
+    from which the caller works out the overlap. Relies on stored profiles
+    being normalized like Profile does.
+    candidate_filter optionally narrows the search, e.g. to candidate _ids.
+    Returns None if the profile can never match anything.
+    """
+    nearby = nearby_query(profile, max_distance)
+    if nearby is None or not profile.subjects or not profile.availability:
+        return None
+
+    query = {
+        **nearby,
+        'subjects': {'$in': profile.subjects},
+        '$or': availability_filters(profile)
+    }
+    if candidate_filter is not None:
+        query['$and'] = [candidate_filter]
+    if exclude_id is not None:
+        query['_id'] = {'$ne': exclude_id}
+
+    lat, lon = profile.location['lat'], profile.location['lon']
+    return [
+        {'$match': query},
+        {'$project': {
+            'name': 1,
+            'subjects': 1,
+            'availability': 1,
+            'distance': {'$sqrt': {'$add': [
+                {'$pow': [{'$subtract': ['$location.lat', lat]}, 2]},
+                {'$pow': [{'$subtract': ['$location.lon', lon]}, 2]}
+            ]}},
+            'availability_slots': 1,
+            'matched_subjects': {'$setIntersection': ['$subjects', profile.subjects]}
+        }},
+        {'$match': {'distance': {'$lte': max_distance}}}
+    ]
+
+def find_match(profile1, profile2, min_overlap=MIN_OVERLAP_HOURS):
     if profile1.match_subjects(profile2):
-        if profile1.match_availability(profile2):
+        if profile1.match_availability(profile2, min_overlap):
             if profile1.match_location(profile2):
                 return "Matched"
     return "Not Matched"
\ No newline at end of file
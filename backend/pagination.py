@@ -0,0 +1,50 @@
+"""Keyset pagination over _id for the collection list endpoints.
+
+Pages are requested with ?limit=<n>&after=<last _id of the previous page>.
+The body stays a plain JSON array; the cursor for the next page is returned
+in the X-Next-Cursor header and is absent on the last page.
+"""
+from bson import ObjectId, errors
+from serialization import json_view, json_response
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+def page_params(args):
+    """Return (limit, after ObjectId or None) from request args; raises ValueError if invalid"""
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+
+    after = args.get('after')
+    if after:
+        try:
+            after = ObjectId(after)
+        except (errors.InvalidId, TypeError):
+            raise ValueError("Invalid after cursor")
+    return min(limit, MAX_PAGE_SIZE), after or None
+
+def page_query(query=None, after=None):
+    """The query restricted to documents after the given _id, as (filter, sort) in _id order"""
+    query = dict(query or {})
+    if after is not None:
+        query['_id'] = {'$gt': after}
+    return query, [('_id', 1)]
+
+def find_page(collection, limit, after=None, query=None, projection=None):
+    """Fetch one JSON-ready page in _id order as (docs, next_cursor) using an _id range, not skip"""
+    query, sort = page_query(query, after)
+    # One extra document tells us whether there is a next page
+    docs = list(json_view(collection).find(query, projection).sort(sort).limit(limit + 1))
+    next_cursor = str(docs[limit - 1]['_id']) if len(docs) > limit else None
+    return docs[:limit], next_cursor
+
+def page_response(items, next_cursor):
+    response = json_response(items)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
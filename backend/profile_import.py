@@ -0,0 +1,132 @@
+"""Bulk profile import from NDJSON, one profile object per line.
+
+    python profile_import.py cohort.ndjson [--chunk-size 1000]
+    curl -X POST --data-binary @cohort.ndjson -H 'Content-Type: application/x-ndjson' \\
+        http://localhost:5001/api/profiles/import
+
+Rows are validated and normalized through Profile exactly like POST
+/api/profiles, then written with unordered insert_many in fixed-size chunks,
+so memory is bounded by the chunk size whatever the upload size. A bad row
+is reported by line number and doesn't stop the rest.
+
+The endpoint keeps the server's match cache and candidate indexes current.
+A running server matches CLI imports at once, as profiles newer than its
+candidate indexes, and drops cached match results at the next index rebuild.
+"""
+import argparse
+import json
+import sys
+import time
+from pymongo.errors import BulkWriteError
+from models import Profile
+
+DEFAULT_CHUNK_SIZE = 1000
+# Per-row errors beyond this are counted but not listed
+MAX_REPORTED_ERRORS = 1000
+REQUIRED_FIELDS = ['name', 'subjects', 'availability', 'location']
+
+def parse_row(line):
+    """Return a normalized Profile for one NDJSON line; raises ValueError if invalid"""
+    try:
+        data = json.loads(line)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {e.msg}")
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+    for field in REQUIRED_FIELDS:
+        if field not in data:
+            raise ValueError(f"Missing field: {field}")
+    # Profile assumes these types and would raise something other than ValueError on others
+    if not isinstance(data['name'], str):
+        raise ValueError("name must be a string")
+    for field in ('subjects', 'availability'):
+        value = data[field]
+        if not (isinstance(value, str) or isinstance(value, list) and all(isinstance(item, str) for item in value)):
+            raise ValueError(f"{field} must be a string or a list of strings")
+    if not isinstance(data['location'], dict):
+        raise ValueError("Invalid location")
+    profile = Profile(data['name'], data['subjects'], data['availability'], data['location'])
+    if not profile.has_location():
+        raise ValueError("Invalid location")
+    return profile
+
+class ImportReport:
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    def error(self, line_number, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_number, "error": message})
+
+    def to_json(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+            "elapsed_s": round(elapsed, 3),
+            "rows_per_s": round((self.inserted + self.failed) / elapsed, 1) if elapsed else None
+        }
+
+def _flush(collection, chunk, report, on_inserted):
+    """insert_many one chunk of (line number, Profile, doc); failed rows go to the report"""
+    failed = {}
+    try:
+        collection.insert_many([doc for _, _, doc in chunk], ordered=False)
+    except BulkWriteError as e:
+        for write_error in e.details.get('writeErrors', []):
+            failed[write_error['index']] = write_error.get('errmsg', 'Write failed')
+    inserted = []
+    for index, (line_number, profile, doc) in enumerate(chunk):
+        if index in failed:
+            report.error(line_number, failed[index])
+        else:
+            # insert_many sets _id on each document before sending it
+            profile._id = str(doc['_id'])
+            inserted.append(profile)
+    report.inserted += len(inserted)
+    if inserted and on_inserted is not None:
+        on_inserted(inserted)
+
+def import_profiles(lines, collection, chunk_size=DEFAULT_CHUNK_SIZE, on_inserted=None):
+    """Import NDJSON lines (str or bytes) into collection and return the report as a dict.
+
+    on_inserted, if given, is called with the Profiles of each written chunk.
+    """
+    report = ImportReport()
+    chunk = []
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        if not line.strip():
+            continue
+        try:
+            profile = parse_row(line)
+        except ValueError as e:
+            report.error(line_number, str(e))
+            continue
+        chunk.append((line_number, profile, profile.to_doc()))
+        if len(chunk) >= chunk_size:
+            _flush(collection, chunk, report, on_inserted)
+            chunk = []
+    if chunk:
+        _flush(collection, chunk, report, on_inserted)
+    return report.to_json()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import profiles from an NDJSON file")
+    parser.add_argument('path', help="NDJSON file, or - for stdin")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    from app import users_collection
+    source = sys.stdin if args.path == '-' else open(args.path, encoding='utf-8')
+    with source:
+        report = import_profiles(source, users_collection, args.chunk_size)
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report['failed'] else 0)
@@ -0,0 +1,26 @@
+"""?fields= projections for the read endpoints.
+
+?fields=name,subjects returns only those fields, plus _id. Without the
+parameter an endpoint returns its default fields. Anything an endpoint does not
+list, such as password hashes or the internal availability bitmap, is never
+read from MongoDB.
+"""
+
+# Public fields of a users_collection profile document
+PROFILE_FIELDS = ('name', 'subjects', 'availability', 'location')
+
+def field_params(args, allowed):
+    """Return the requested field names, default all of allowed; raises ValueError if unknown"""
+    requested = args.get('fields')
+    if not requested:
+        return list(allowed)
+    fields = [field.strip() for field in requested.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed and field != '_id']
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    # _id is always returned
+    return [field for field in dict.fromkeys(fields) if field != '_id']
+
+def projection(fields):
+    """Inclusion projection for the given fields; _id alone if none"""
+    return dict.fromkeys(fields, 1) or {'_id': 1}
@@ -0,0 +1,60 @@
+"""Scored top-k selection over match results, with opaque cursors for paging"""
+import base64
+import heapq
+from models import MAX_MATCH_DISTANCE
+from availability import hours
+
+SUBJECT_WEIGHT = 0.5
+AVAILABILITY_WEIGHT = 0.3
+DISTANCE_WEIGHT = 0.2
+
+def score_match(source_profile, match, max_distance=MAX_MATCH_DISTANCE):
+    """Score a match in [0, 1] from subject overlap, availability overlap and closeness"""
+    subject_overlap = len(match['matched_subjects']) / max(1, len(set(source_profile.subjects)))
+    if source_profile.availability_slots:
+        # Share of the source's free hours that the match is also free
+        availability_overlap = match['overlap_hours'] / hours(source_profile.availability_slots)
+    else:
+        availability_overlap = len(match['matched_availability']) / max(1, len(source_profile.availability))
+    closeness = max(0.0, 1 - match['distance'] / max_distance)
+    return round(SUBJECT_WEIGHT * subject_overlap +
+                 AVAILABILITY_WEIGHT * availability_overlap +
+                 DISTANCE_WEIGHT * closeness, 6)
+
+def encode_cursor(match):
+    raw = f"{match['score']!r}:{match['_id']}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Return the (score, _id) position a cursor points at; raises ValueError if malformed"""
+    try:
+        score, match_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split(':', 1)
+        return float(score), match_id
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def _rank_key(match):
+    # Highest score first, ties broken by id so pages are stable
+    return (-match['score'], match['_id'])
+
+def top_k(source_profile, matches, k, cursor=None):
+    """Return (page, next_cursor) with the k best-scoring matches after cursor.
+
+    matches can be any iterable, including a live database cursor; it is
+    consumed once through a bounded heap and never sorted or held in full.
+    """
+    after = None
+    if cursor:
+        score, match_id = decode_cursor(cursor)
+        after = (-score, match_id)
+
+    def scored():
+        for match in matches:
+            ranked = dict(match, score=score_match(source_profile, match))
+            if after is None or _rank_key(ranked) > after:
+                yield ranked
+
+    # Select one extra to learn whether another page exists
+    page = heapq.nsmallest(k + 1, scored(), key=_rank_key)
+    next_cursor = encode_cursor(page[k - 1]) if len(page) > k else None
+    return page[:k], next_cursor
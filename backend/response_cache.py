@@ -0,0 +1,87 @@
+"""LRU cache of serialized JSON list responses with strong ETags.
+
+Entries are keyed by endpoint and query string and hold the encoded body, so
+a hit is served without touching MongoDB or re-encoding. Requests whose
+If-None-Match carries the current ETag get a bodiless 304. Write routes call
+invalidate(endpoint) to drop every cached query of that endpoint.
+"""
+from collections import OrderedDict
+import hashlib
+import threading
+from flask import Response
+
+# Response headers worth replaying from the cache
+CACHED_HEADERS = ('Content-Type', 'X-Next-Cursor')
+
+class ResponseCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (endpoint, query string) -> (body, etag, headers)
+        self._generations = {}  # endpoint -> number of invalidations so far
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def _respond(self, request, body, etag, headers):
+        if request.if_none_match.contains(etag):
+            self.not_modified += 1
+            response = Response(status=304)
+        else:
+            response = Response(body, headers=headers)
+        response.set_etag(etag)
+        return response
+
+    def lookup(self, request, endpoint):
+        """Return (cached response or None, generation to pass to store on a miss)"""
+        key = (endpoint, request.query_string)
+        with self._lock:
+            generation = self._generations.get(endpoint, 0)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, generation
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._respond(request, *entry), generation
+
+    def store(self, request, endpoint, generation, response):
+        """Cache a freshly built 200 response and return it with its ETag (or a 304).
+
+        Nothing is cached if the endpoint was invalidated since lookup, so a
+        read racing a write can't store a stale page.
+        """
+        body = response.get_data()
+        etag = hashlib.sha1(body).hexdigest()
+        headers = [(name, response.headers[name]) for name in CACHED_HEADERS if name in response.headers]
+        key = (endpoint, request.query_string)
+        with self._lock:
+            if self._generations.get(endpoint, 0) == generation:
+                self._entries[key] = (body, etag, headers)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            return self._respond(request, body, etag, headers)
+
+    def invalidate(self, endpoint):
+        with self._lock:
+            self._generations[endpoint] = self._generations.get(endpoint, 0) + 1
+            stale = [key for key in self._entries if key[0] == endpoint]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions
+            }
@@ -1,23 +1,90 @@
-from app import app, users_collection, meetings_collection
-from flask import request, jsonify
+from app import app, socketio, db, users_collection, meetings_collection, response_cache, page_flights, chat_writer, room_log, call_registry
+from flask import Response, request, jsonify
 from bson import ObjectId, errors
-from models import Profile, find_match
+from pymongo import ReturnDocument
+from models import Profile, match_pipeline, search_query, MIN_OVERLAP_HOURS
+from match_cache import MatchCache
+from ranking import top_k
+from inverted_index import ProfileIndex, candidate_filter
+from lsh import ProfileLSH
+from pagination import page_params, find_page, page_response
+from streaming import stream_format, stream_cursor
+from serialization import json_view, json_response
+from projection import PROFILE_FIELDS, field_params, projection
+from profile_import import import_profiles, DEFAULT_CHUNK_SIZE
+from export import EXPORT_COLLECTIONS, DEFAULT_BATCH_SIZE, ExportStats, export_chunks, export_projection, \
+    export_query, parse_date
+import os
+
+# Subject/availability posting lists, built at startup, kept current by the write routes and
+# rebuilt from MongoDB in the background once older than PROFILE_INDEX_MAX_AGE seconds to pick up
+# writes made elsewhere
+PROFILE_INDEX_MAX_AGE = float(os.getenv('PROFILE_INDEX_MAX_AGE', 300))
+# How often the background task checks whether the indexes are due for a rebuild
+PROFILE_INDEX_CHECK_INTERVAL = 5
+
+# Match results per source profile, invalidated by the profile write routes below; entries
+# also expire after PROFILE_INDEX_MAX_AGE, for writes made outside this process
+match_cache = MatchCache(max_entries=int(os.getenv('MATCH_CACHE_SIZE', 1024)), max_age=PROFILE_INDEX_MAX_AGE)
+
+# Largest page a ranked /api/matches request may ask for
+MAX_MATCH_LIMIT = 100
+
+profile_index = ProfileIndex(max_age=PROFILE_INDEX_MAX_AGE)
+# Above this many candidates, querying by _id costs more than letting MongoDB filter
+MAX_CANDIDATE_IDS = 50000
+# MinHash/LSH buckets for ?mode=approx matching, maintained like profile_index
+profile_lsh = ProfileLSH(max_age=PROFILE_INDEX_MAX_AGE)
+
+def refresh_indexes():
+    """Background task building the candidate indexes at startup and again whenever they go stale"""
+    while True:
+        for index in (profile_index, profile_lsh):
+            try:
+                index.build(users_collection)
+            except Exception as e:
+                # Until a build succeeds, queries go unnarrowed and MongoDB does all the filtering
+                print(f"Error building {type(index).__name__}: {e}")
+        socketio.sleep(PROFILE_INDEX_CHECK_INTERVAL)
+
+socketio.start_background_task(refresh_indexes)
+
+def profile_written(profile_id, old_profile=None, new_profile=None):
+    """Bring the match cache and candidate indexes up to date after a profile write"""
+    match_cache.invalidate(profile_id, old_profile=old_profile, new_profile=new_profile)
+    if new_profile is None:
+        profile_index.remove(profile_id)
+        profile_lsh.remove(profile_id)
+    else:
+        profile_index.add(profile_id, new_profile.subjects, new_profile.availability_keys())
+        profile_lsh.add(profile_id, new_profile.subjects, new_profile.availability_keys())
+
+def profile_json(doc, fields):
+    """Profile.to_json() of a projected document, limited to the requested fields"""
+    return {key: value for key, value in Profile.from_doc(doc).to_json().items()
+            if key == '_id' or key in fields}
 
 # Route to add a new profile
 @app.route('/api/profiles', methods=['GET'])
 def get_profiles():
     try:
-        profiles = []
-        for doc in users_collection.find():
-            profile = Profile(
-                doc['name'],
-                doc['subjects'],
-                doc['availability'],
-                doc['location'],
-                str(doc['_id'])
-            )
-            profiles.append(profile.to_json())
-        return jsonify(profiles)
+        try:
+            limit, after = page_params(request.args)
+            fields = field_params(request.args, PROFILE_FIELDS)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Login accounts share the collection; only documents with profile fields are listed
+        query = {'subjects': {'$exists': True}}
+        fmt = stream_format(request)
+        if fmt:
+            # Whole collection, encoded as the cursor is read
+            return stream_cursor(users_collection, fmt, query, after, projection(fields),
+                                 transform=lambda doc: profile_json(doc, fields))
+
+        docs, next_cursor = find_page(users_collection, limit, after, query, projection(fields))
+        profiles = [profile_json(doc, fields) for doc in docs]
+        return page_response(profiles, next_cursor)
     except Exception as e:
         print(f"Error retrieving profiles from database: {e}")
         return []
@@ -40,19 +107,18 @@ def create_profile():
             availability=data.get('availability'),
             location=data.get('location')
         )
+        if not new_profile.has_location():
+            return jsonify({"error": "Invalid location"}), 400
 
-        # Manually create a dictionary for the new profile
-        profile_dict = {
-            'name': data.get('name'),
-            'subjects': data.get('subjects'),
-            'availability': data.get('availability'),
-            'location': data.get('location')
-        }
+        # Stored normalized so matching can filter on subjects/availability in MongoDB
+        profile_dict = new_profile.to_doc()
         
         # Insert into MongoDB
         result = users_collection.insert_one(profile_dict)
         
         if result.inserted_id:
+            new_profile._id = str(result.inserted_id)
+            profile_written(new_profile._id, new_profile=new_profile)
             return jsonify({
                 "message": "Profile added successfully",
                 "_id": str(result.inserted_id)
@@ -64,6 +130,31 @@ def create_profile():
         print(f"Error adding profile to database: {e}")
         return jsonify({"error": str(e)}), 500
 
+def profiles_imported(profiles):
+    """profile_written for a whole import chunk; clearing the cache beats checking each row against it"""
+    match_cache.clear()
+    for profile in profiles:
+        profile_index.add(profile._id, profile.subjects, profile.availability_keys())
+        profile_lsh.add(profile._id, profile.subjects, profile.availability_keys())
+
+# Route to bulk import profiles from an NDJSON body
+@app.route('/api/profiles/import', methods=['POST'])
+def import_profiles_route():
+    try:
+        try:
+            chunk_size = int(request.args.get('chunk_size', DEFAULT_CHUNK_SIZE))
+        except ValueError:
+            return jsonify({"error": "chunk_size must be an integer"}), 400
+        if chunk_size < 1:
+            return jsonify({"error": "chunk_size must be positive"}), 400
+
+        # Read line by line from the request stream rather than buffering the upload
+        report = import_profiles(request.stream, users_collection, chunk_size, on_inserted=profiles_imported)
+        return jsonify(report), 200
+    except Exception as e:
+        print(f"Error importing profiles: {e}")
+        return jsonify({"error": str(e)}), 500
+
 # Route to delete a profile
 @app.route('/api/profiles/<profile_id>', methods=['DELETE'])
 def delete_profile(profile_id):
@@ -76,16 +167,25 @@ def delete_profile(profile_id):
         except errors.InvalidId:
             return jsonify({"error": "Invalid profile ID"}), 400
 
-        profile = users_collection.find_one({'_id': object_id})
+        # One round trip: the deleted document comes back for the cache/index hooks
+        profile = users_collection.find_one_and_delete({'_id': object_id}, projection(PROFILE_FIELDS))
         if profile is None:
             return jsonify({"error": "Profile not found"}), 404
 
-        users_collection.delete_one({'_id': object_id})
+        profile_written(str(object_id), old_profile=Profile.from_doc(profile))
         return jsonify({"message": "Profile deleted successfully", "id": profile_id}), 200
     except Exception as e:
         print(f"Error deleting profile from database: {e}")
         return jsonify({"error": str(e)}), 500
 
+# Stored document fields written when a PATCH supplies each profile field
+UPDATE_FIELDS = {
+    'name': ('name',),
+    'subjects': ('subjects',),
+    'availability': ('availability', 'availability_slots', 'availability_days'),
+    'location': ('location',)
+}
+
 # Route to update a profile
 @app.route('/api/profiles/<profile_id>', methods=['PATCH'])
 def update_profile(profile_id):
@@ -98,22 +198,30 @@ def update_profile(profile_id):
         except errors.InvalidId:
             return jsonify({"error": "Invalid profile ID"}), 400
 
-        profile = users_collection.find_one({'_id': object_id})
+        # Normalize only the supplied fields; the rest of the document is left as stored
+        data = request.json
+        supplied = Profile(data.get('name'), data.get('subjects'), data.get('availability'), data.get('location'))
+        if 'location' in data and not supplied.has_location():
+            return jsonify({"error": "Invalid location"}), 400
+        doc = supplied.to_doc()
+        update = {key: doc[key] for field, keys in UPDATE_FIELDS.items() if field in data for key in keys}
+
+        # One round trip: the previous version comes back and the new one is that plus the $set
+        profiles = json_view(users_collection)
+        if update:
+            profile = profiles.find_one_and_update({'_id': object_id}, {'$set': update}, projection(PROFILE_FIELDS),
+                                                   return_document=ReturnDocument.BEFORE)
+        else:
+            profile = profiles.find_one({'_id': object_id}, projection(PROFILE_FIELDS))
         if profile is None:
             return jsonify({"error": "Profile not found"}), 404
 
-        data = request.json
-        update_data = {
-            'name': data.get('name', profile['name']),
-            'subjects': data.get('subjects', profile['subjects']),
-            'availability': data.get('availability', profile['availability']),
-            'location': data.get('location', profile['location'])
-        }
-
-        users_collection.update_one({'_id': object_id}, {'$set': update_data})
-        updated_profile = users_collection.find_one({'_id': object_id})
-        updated_profile['_id'] = str(updated_profile['_id'])
-        return jsonify({"message": "Profile updated", "profile": updated_profile}), 200
+        updated_profile = {key: value for key, value in {**profile, **update}.items()
+                           if key == '_id' or key in PROFILE_FIELDS}
+        if update:
+            normalized = Profile.from_doc(updated_profile)
+            profile_written(str(object_id), old_profile=Profile.from_doc(profile), new_profile=normalized)
+        return json_response({"message": "Profile updated", "profile": updated_profile})
     except Exception as e:
         print(f"Error updating profile in database: {e}")
         return jsonify({"error": str(e)}), 500
@@ -122,62 +230,115 @@ def update_profile(profile_id):
 @app.route('/api/profiles/<profile_id>', methods=['GET'])
 def get_profile(profile_id):
     try:
+        try:
+            fields = field_params(request.args, PROFILE_FIELDS)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
         object_id = ObjectId(profile_id)
-        profile = users_collection.find_one({'_id': object_id})
+        profile = json_view(users_collection).find_one({'_id': object_id}, projection(fields))
         if profile:
-            profile['_id'] = str(profile['_id'])
-            return jsonify(profile)
+            return json_response(profile)
         return jsonify({"error": "Profile not found"}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def iter_matches(source_profile, object_id, approximate=False, min_overlap=MIN_OVERLAP_HOURS):
+    """Run the match aggregation for a source profile and yield results shaped for the API"""
+    # Profiles colliding in the MinHash buckets (cheaper but may miss some matches), or
+    # profiles sharing a subject and a free day from posting-list intersection
+    # (built by refresh_indexes; until then MongoDB filters on its own)
+    index = profile_lsh if approximate else profile_index
+    narrowed = None
+    if index.built:
+        candidates = list(index.candidates(source_profile.subjects, source_profile.availability_keys()))
+        narrowed = candidate_filter(candidates, index.watermark, MAX_CANDIDATE_IDS)
+
+    # Subject, availability and radius checks all run in MongoDB, so only real matches come back
+    pipeline = match_pipeline(source_profile, exclude_id=object_id, candidate_filter=narrowed)
+    matched_docs = users_collection.aggregate(pipeline) if pipeline else []
+
+    for doc in matched_docs:
+        # MongoDB only checked for one shared hour; the overlap length is worked out here
+        candidate = Profile.from_doc(doc)
+        if not source_profile.match_availability(candidate, min_overlap):
+            continue
+        yield {
+            "_id": str(doc['_id']),
+            "name": doc['name'],
+            "subjects": source_profile._capitalize_list(candidate.subjects),
+            "availability": source_profile._capitalize_list(candidate.availability),
+            "distance": round(doc['distance'], 2),
+            "overlap_hours": source_profile.availability_overlap(candidate),
+            "matched_subjects": source_profile._capitalize_list(doc['matched_subjects']),
+            "matched_availability": source_profile._capitalize_list(source_profile.matched_availability(candidate))
+        }
+
+def compute_matches(source_profile, object_id):
+    return list(iter_matches(source_profile, object_id))
+
 @app.route('/api/matches/<profile_id>', methods=['GET'])
 def find_matches(profile_id):
     try:
-        # Get the profile we want to match
         object_id = ObjectId(profile_id)
-        source_doc = users_collection.find_one({'_id': object_id})
-        
-        if not source_doc:
-            return jsonify({"error": "Profile not found"}), 404
 
-        # Create Profile object for source profile
-        source_profile = Profile(
-            name=source_doc['name'],
-            subjects=source_doc['subjects'],
-            availability=source_doc['availability'],
-            location=source_doc['location'],
-            _id=str(source_doc['_id'])
-        )
+        # Ranked mode: ?limit=<k> (or ?k=) returns the k best-scoring matches, ?cursor= the next page
+        limit_param = request.args.get('limit') or request.args.get('k')
+        limit = None
+        if limit_param is not None:
+            try:
+                limit = min(int(limit_param), MAX_MATCH_LIMIT)
+            except ValueError:
+                return jsonify({"error": "limit must be an integer"}), 400
+            if limit < 1:
+                return jsonify({"error": "limit must be positive"}), 400
 
-        matches = []
-        all_profiles = users_collection.find({'_id': {'$ne': object_id}})
-        
-        for doc in all_profiles:
-            potential_match = Profile(
-                name=doc['name'],
-                subjects=doc['subjects'],
-                availability=doc['availability'],
-                location=doc['location'],
-                _id=str(doc['_id'])
-            )
-            
-            match_result = find_match(source_profile, potential_match)
-            
-            if match_result == "Matched":
-                # Get matched items
-                matched_subjects = list(set(source_profile.subjects) & set(potential_match.subjects))
-                matched_availability = list(set(source_profile.availability) & set(potential_match.availability))
-                
-                matches.append({
-                    "_id": potential_match._id,
-                    "name": potential_match.name,
-                    "subjects": potential_match._capitalize_list(potential_match.subjects),
-                    "availability": potential_match._capitalize_list(potential_match.availability),
-                    "distance": round(source_profile.calculate_distance(potential_match), 2),
-                    "matched_subjects": potential_match._capitalize_list(matched_subjects),
-                    "matched_availability": potential_match._capitalize_list(matched_availability)
-                })
+        # ?min_overlap=<hours> requires that many shared free hours
+        try:
+            min_overlap = int(request.args.get('min_overlap', MIN_OVERLAP_HOURS))
+        except ValueError:
+            return jsonify({"error": "min_overlap must be an integer"}), 400
+        if min_overlap < 1:
+            # The pipeline always requires a shared hour, so fewer can't be honoured
+            return jsonify({"error": "min_overlap must be at least 1"}), 400
+
+        # ?mode=approx uses the LSH candidates; only default exact results are cached
+        approximate = request.args.get('mode') == 'approx'
+        cacheable = not approximate and min_overlap == MIN_OVERLAP_HOURS
+        cached = match_cache.get(str(object_id)) if cacheable else None
+        # Taken before reading MongoDB, so a write racing this computation keeps it out of the cache
+        generation = match_cache.generation()
+        if cached is not None:
+            source_profile, matches = cached
+        else:
+            # Get the profile we want to match
+            source_doc = users_collection.find_one({'_id': object_id})
+
+            if not source_doc:
+                return jsonify({"error": "Profile not found"}), 404
+
+            source_profile = Profile.from_doc(source_doc)
+            if cacheable:
+                # Computed in full once and cached; ranked pages are then taken from the cached list
+                matches = compute_matches(source_profile, object_id)
+                match_cache.put(str(object_id), source_profile, matches, generation)
+            elif limit is not None:
+                # Stream straight into the top-k heap instead of building the full list
+                matches = iter_matches(source_profile, object_id, approximate, min_overlap)
+            else:
+                matches = list(iter_matches(source_profile, object_id, approximate, min_overlap))
+
+        if limit is not None:
+            try:
+                page, next_cursor = top_k(source_profile, matches, limit, request.args.get('cursor'))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            return jsonify({
+                "profile_id": profile_id,
+                "matches": page,
+                "match_count": len(page),
+                "next_cursor": next_cursor
+            }), 200
 
         if matches:
             return jsonify({
@@ -214,22 +375,76 @@ def search_profiles():
             # If it's already a list, use it as is
             return param if isinstance(param, list) else [param]
 
-        subjects = parse_param(subjects_param)
-        availabilities = parse_param(availability_param)
+        # Normalized the same way stored profiles are, including time slots
+        wanted = Profile(None, parse_param(subjects_param), parse_param(availability_param), None)
+        try:
+            fields = field_params(request.args, PROFILE_FIELDS)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        # Build query
-        query = {}
-        if subjects:
-            query['subjects'] = {'$in': subjects}
-        if availabilities:
-            query['availability'] = {'$in': availabilities}
-            
+        narrowed = None
+        if (wanted.subjects or wanted.availability) and profile_index.built:
+            # Narrow to ids from the posting lists rather than scanning; the day keys are
+            # coarse and the index may lag other writers, so the real filters still apply
+            candidates = profile_index.candidates(wanted.subjects or None, wanted.availability_keys() or None)
+            narrowed = candidate_filter(candidates, profile_index.watermark, MAX_CANDIDATE_IDS)
+        query = search_query(wanted, narrowed)
+
         # Find matching profiles
-        profiles = list(users_collection.find(query))
-        for profile in profiles:
-            profile['_id'] = str(profile['_id'])
-            
-        return jsonify(profiles)
+        profiles = list(json_view(users_collection).find(query, projection(fields)))
+        return json_response(profiles)
     except Exception as e:
         print(f"Error searching profiles: {e}")
         return jsonify({"error": str(e)}), 500
+
+# Stream a whole collection as NDJSON or CSV for analytics
+@app.route('/api/export/<collection_name>', methods=['GET'])
+def export_collection(collection_name):
+    try:
+        if collection_name not in EXPORT_COLLECTIONS:
+            return jsonify({"error": "Unknown collection"}), 404
+
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in ('ndjson', 'csv'):
+            return jsonify({"error": "format must be ndjson or csv"}), 400
+        compress = request.args.get('gzip') in ('1', 'true')
+        fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()] or None
+        try:
+            batch_size = int(request.args.get('batch_size', DEFAULT_BATCH_SIZE))
+            if batch_size < 1:
+                raise ValueError("batch_size must be positive")
+            since = parse_date(request.args['since']) if request.args.get('since') else None
+            until = parse_date(request.args['until']) if request.args.get('until') else None
+            projection = export_projection(collection_name, fields)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        stats = ExportStats()
+        query = export_query(since, until, collection_name)
+        chunks = export_chunks(db[collection_name], fmt, query, projection, fields, batch_size, compress, stats)
+
+        def logged():
+            yield from chunks
+            print(f"Exported {collection_name}: {stats.to_json()}")
+
+        filename = f"{collection_name}.{fmt}" + ('.gz' if compress else '')
+        mimetype = 'application/gzip' if compress else ('text/csv' if fmt == 'csv' else 'application/x-ndjson')
+        return Response(logged(), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+    except Exception as e:
+        print(f"Error exporting {collection_name}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+# Cache and index counters for monitoring
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return jsonify({
+        "match_cache": match_cache.stats(),
+        "profile_index": profile_index.stats(),
+        "profile_lsh": profile_lsh.stats(),
+        "response_cache": response_cache.stats(),
+        "page_flights": page_flights.stats(),
+        "chat_writer": chat_writer.stats(),
+        "room_log": room_log.stats(),
+        "calls": call_registry.stats()
+    }), 200
@@ -0,0 +1,55 @@
+"""BSON to JSON for the read endpoints without per-handler conversion loops.
+
+Collections read through json_view() have ObjectId and datetime values turned
+into strings by the BSON decoder itself, so documents come off the cursor
+ready for json.dumps. json_response() then encodes the body in one compact
+pass, without the key sorting jsonify does.
+"""
+from datetime import datetime, timezone
+import json
+from bson import ObjectId
+from bson.codec_options import CodecOptions, TypeDecoder, TypeRegistry
+from flask import Response
+
+def _isoformat(value):
+    # PyMongo decodes naive datetimes that are UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.isoformat()
+
+class ObjectIdDecoder(TypeDecoder):
+    bson_type = ObjectId
+
+    def transform_bson(self, value):
+        return str(value)
+
+class DatetimeDecoder(TypeDecoder):
+    bson_type = datetime
+
+    def transform_bson(self, value):
+        return _isoformat(value)
+
+JSON_CODEC_OPTIONS = CodecOptions(type_registry=TypeRegistry([ObjectIdDecoder(), DatetimeDecoder()]))
+
+def json_view(collection):
+    """The same collection, decoding documents straight into JSON-ready values"""
+    return collection.with_options(codec_options=JSON_CODEC_OPTIONS)
+
+def _default(value):
+    # Values built in Python rather than read through json_view
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return _isoformat(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def jsonable(doc):
+    """Copy of a document built in Python with its top-level ObjectId/datetime values as strings"""
+    return {key: _default(value) if isinstance(value, (ObjectId, datetime)) else value
+            for key, value in doc.items()}
+
+def dumps(value):
+    return json.dumps(value, default=_default, separators=(',', ':'))
+
+def json_response(payload, status=200):
+    return Response(dumps(payload), status=status, mimetype='application/json')
@@ -0,0 +1,68 @@
+"""Single-flight coalescing of identical concurrent reads.
+
+The first caller for a key runs the query; callers arriving while it is in
+flight wait for it and share its result (or its exception) instead of
+issuing their own. Nothing is kept once the call finishes - caching is the
+response cache's job.
+
+Under eventlet, waiters must block on a green event rather than an OS-level
+one, so the event class is injectable; app.py passes the Socket.IO server's
+create_event, which matches its async mode.
+"""
+import threading
+
+class _Call:
+    def __init__(self, event):
+        self.event = event
+        self.waiters = 0
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    def __init__(self, event_factory=threading.Event):
+        self.event_factory = event_factory
+        self._calls = {}  # key -> in-flight _Call
+        # Only held for dict updates, never across a wait, so it can't block a green thread switch
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+
+    def do(self, key, fn):
+        """Return fn(), sharing one execution among concurrent callers with the same key"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call(self.event_factory())
+                self.calls += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                self.max_waiters = max(self.max_waiters, call.waiters)
+            call.event.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": {key: call.waiters for key, call in self._calls.items()},
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "max_waiters": self.max_waiters
+            }
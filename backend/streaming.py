@@ -0,0 +1,47 @@
+"""Streaming JSON array / NDJSON responses written straight from a PyMongo cursor.
+
+Used when a list endpoint is called with ?stream=json or ?stream=ndjson (or
+with Accept: application/x-ndjson): documents are encoded one at a time as
+the cursor yields them, so memory stays flat whatever the collection size.
+"""
+from flask import Response
+from serialization import json_view, dumps
+from pagination import page_query
+
+# Documents per getMore round trip while streaming
+STREAM_BATCH_SIZE = 1000
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+def stream_format(request):
+    """'json', 'ndjson' or None if the request did not ask for a streamed response"""
+    requested = request.args.get('stream')
+    if requested in ('json', 'ndjson'):
+        return requested
+    if request.accept_mimetypes.best == NDJSON_MIMETYPE:
+        return 'ndjson'
+    return None
+
+def _json_array(docs):
+    yield '['
+    first = True
+    for doc in docs:
+        yield dumps(doc) if first else ',' + dumps(doc)
+        first = False
+    yield ']'
+
+def _ndjson(docs):
+    for doc in docs:
+        yield dumps(doc) + '\n'
+
+def stream_docs(docs, fmt):
+    """Stream documents from any iterable as a JSON array or NDJSON"""
+    if fmt == 'ndjson':
+        return Response(_ndjson(docs), mimetype=NDJSON_MIMETYPE)
+    return Response(_json_array(docs), mimetype='application/json')
+
+def stream_cursor(collection, fmt, query=None, after=None, projection=None, transform=None):
+    """Stream every matching document in _id order, starting after the given _id"""
+    query, sort = page_query(query, after)
+    cursor = json_view(collection).find(query, projection).sort(sort).batch_size(STREAM_BATCH_SIZE)
+    docs = (transform(doc) for doc in cursor) if transform else cursor
+    return stream_docs(docs, fmt)
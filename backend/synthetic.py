@@ -0,0 +1,51 @@
+"""Synthetic student profiles for benchmarks: Zipfian subject popularity, clustered campus locations"""
+import random
+
+DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+PERIODS = ['morning', 'afternoon', 'evening']
+
+# Campus centers (lat, lon) that profiles cluster around
+CAMPUSES = [
+    (33.21, -97.15),
+    (32.73, -97.11),
+    (30.28, -97.73),
+    (29.72, -95.34),
+    (40.81, -73.96),
+    (37.87, -122.26),
+    (41.79, -87.60),
+    (42.36, -71.09)
+]
+
+def subject_names(count):
+    departments = ['math', 'cs', 'phys', 'chem', 'bio', 'econ', 'hist', 'engl', 'psyc', 'phil']
+    return [f"{departments[i % len(departments)]} {1000 + i}" for i in range(count)]
+
+def zipf_weights(count, exponent=1.1):
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+def availability_token(rng, day):
+    """A whole day, a named period or an hour range, in roughly equal shares"""
+    kind = rng.random()
+    if kind < 0.3:
+        return day
+    if kind < 0.6:
+        return f"{day} {rng.choice(PERIODS)}"
+    start = rng.randint(8, 20)
+    return f"{day} {start}-{start + rng.randint(1, 3)}"
+
+def generate_docs(count, seed=0, subject_count=500, zipf_exponent=1.1, campus_spread=0.05):
+    """Yield count users_collection-style profile documents, deterministically for a seed"""
+    rng = random.Random(seed)
+    subjects = subject_names(subject_count)
+    weights = zipf_weights(subject_count, zipf_exponent)
+    for i in range(count):
+        lat, lon = rng.choice(CAMPUSES)
+        yield {
+            'name': f"Student {i}",
+            'subjects': sorted(set(rng.choices(subjects, weights=weights, k=rng.randint(1, 5)))),
+            'availability': [availability_token(rng, day) for day in sorted(rng.sample(DAYS, rng.randint(1, 4)))],
+            'location': {
+                'lat': round(rng.gauss(lat, campus_spread), 6),
+                'lon': round(rng.gauss(lon, campus_spread), 6)
+            }
+        }
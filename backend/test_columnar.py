@@ -0,0 +1,66 @@
+"""Parity of columnar.ProfileStore.find_matches with per-pair find_match.
+
+    python -m pytest test_columnar.py
+"""
+import pytest
+from models import Profile, find_match
+from columnar import ProfileStore
+import synthetic
+
+FREE_TEXT = ['anytime', 'after class', 'by appointment']
+
+def synthetic_profiles(count, seed=0):
+    """Synthetic profiles plus the awkward cases: missing locations and free-text availability"""
+    profiles = []
+    for i, doc in enumerate(synthetic.generate_docs(count, seed=seed, subject_count=20)):
+        if i % 7 == 0:
+            doc['location'] = None
+        elif i % 11 == 0:
+            del doc['location']
+        if i % 5 == 0:
+            doc['availability'].append(FREE_TEXT[i % len(FREE_TEXT)])
+        if i % 13 == 0:
+            doc['availability'] = [FREE_TEXT[i % len(FREE_TEXT)]]
+        profile = Profile.from_doc(doc)
+        profile._id = str(i)
+        profiles.append(profile)
+    return profiles
+
+@pytest.fixture(scope='module')
+def profiles():
+    return synthetic_profiles(400)
+
+@pytest.fixture(scope='module')
+def store(profiles):
+    return ProfileStore(profiles)
+
+def expected_ids(source, profiles, min_overlap=1):
+    return [p._id for p in profiles if find_match(source, p, min_overlap) == "Matched"]
+
+def test_fixture_has_edge_cases(profiles):
+    assert any(not p.has_location() for p in profiles)
+    assert any(p.unparsed_availability and p.availability_slots for p in profiles)
+    assert any(p.unparsed_availability and not p.availability_slots for p in profiles)
+
+@pytest.mark.parametrize('min_overlap', [1, 3])
+def test_matches_same_profiles_as_find_match(profiles, store, min_overlap):
+    for source in profiles:
+        found = [match.profile._id for match in store.find_matches(source, min_overlap=min_overlap)]
+        assert found == expected_ids(source, profiles, min_overlap), source._id
+
+def test_match_details(profiles, store):
+    for source in profiles[:100]:
+        for match in store.find_matches(source):
+            other = match.profile
+            assert match.distance == pytest.approx(source.calculate_distance(other))
+            assert sorted(match.matched_subjects) == sorted(set(source.subjects) & set(other.subjects))
+            assert match.matched_availability == source.matched_availability(other)
+            assert match.overlap_hours == source.availability_overlap(other)
+
+def test_source_outside_store(profiles, store):
+    for source in synthetic_profiles(50, seed=1):
+        found = [match.profile._id for match in store.find_matches(source)]
+        assert found == expected_ids(source, profiles)
+
+def test_empty_store(profiles):
+    assert ProfileStore().find_matches(profiles[0]) == []
@@ -0,0 +1,29 @@
+"""Every endpoint query in indexes.QUERY_PLANS is served by an index, as `python indexes.py --check` checks.
+
+    MONGODB_URI=mongodb://... python -m pytest test_query_plans.py
+
+Needs a real MongoDB and is skipped without MONGODB_URI. The indexes are built
+in a scratch database, dropped afterwards.
+"""
+import os
+import certifi
+import pytest
+from pymongo import MongoClient
+from indexes import ensure_indexes, check_query_plans
+
+MONGODB_URI = os.getenv('MONGODB_URI')
+pytestmark = pytest.mark.skipif(not MONGODB_URI, reason="MONGODB_URI is not set")
+
+@pytest.fixture(scope='module')
+def db():
+    client = MongoClient(MONGODB_URI, tlsCAFile=certifi.where())
+    scratch = client['StudyGroupMatcher_query_plans']
+    try:
+        assert ensure_indexes(scratch) == []
+        yield scratch
+    finally:
+        client.drop_database(scratch.name)
+        client.close()
+
+def test_no_collection_scans_or_blocking_sorts(db):
+    assert check_query_plans(db) == []